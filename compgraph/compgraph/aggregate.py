@@ -0,0 +1,215 @@
+import itertools
+import os
+import pickle
+import shutil
+import tempfile
+import typing as tp
+
+from operator import itemgetter
+
+from . import operations as ops
+from .external_sort import merge_runs, read_run, write_run
+
+
+MAX_GROUPS = 1 << 20
+COMBINE_MAX_GROUPS = 1 << 16
+STATE_COLUMN = '__state__'
+PARTITIONS = 16
+PARTITION_CHUNK_SIZE = 1024
+
+TGroups = dict[bytes, tuple[ops.TRow, tp.Any]]
+
+
+def spill_groups(groups: TGroups, files: list[tp.BinaryIO]) -> None:
+    """Append (encoded key, key values, state) of groups to partition files by hash of key"""
+    chunks: list[list[tuple[bytes, ops.TRow, tp.Any]]] = [[] for _ in files]
+    for key, (key_values, state) in groups.items():
+        partition = hash(key) % len(files)
+        chunks[partition].append((key, key_values, state))
+        if len(chunks[partition]) >= PARTITION_CHUNK_SIZE:
+            pickle.dump(chunks[partition], files[partition], pickle.HIGHEST_PROTOCOL)
+            chunks[partition] = []
+
+    for partition, chunk in enumerate(chunks):
+        if chunk:
+            pickle.dump(chunk, files[partition], pickle.HIGHEST_PROTOCOL)
+
+
+def read_groups(path: str) -> tp.Generator[tuple[bytes, ops.TRow, tp.Any], None, None]:
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                break
+            yield from chunk
+
+
+class HashAggregate(ops.Operation):
+    """
+    Reduce of unsorted input with combinable reducer: states of groups are kept
+    in a hash table by encoded keys and updated by every row in one pass.
+    When there are more than max_groups groups, partial states are spilled
+    to disk partitioned by hash of keys and merged partition by partition.
+    Only the distinct groups are sorted, output is sorted by keys as after sort and reduce
+    """
+
+    def __init__(
+        self, reducer: ops.CombinableReducer, keys: tp.Sequence[str],
+        max_groups: int = MAX_GROUPS, partitions: int = PARTITIONS
+    ) -> None:
+        """
+        :param reducer: combinable reducer to use
+        :param keys: keys for grouping
+        :param max_groups: number of groups to keep in memory
+        :param partitions: number of partitions to spill groups to when they do not fit in memory
+        """
+        self.reducer = reducer
+        self.keys = tuple(keys)
+        self.max_groups = max_groups
+        self.partitions = partitions
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        row_key = ops.row_key(self.keys)
+        reducer = self.reducer
+        groups: TGroups = {}
+        directory: tp.Optional[str] = None
+        files: list[tp.BinaryIO] = []
+        try:
+            for row in rows:
+                key = row_key(row)
+                group = groups.get(key)
+                if group is None:
+                    if len(groups) >= self.max_groups:
+                        if directory is None:
+                            directory = tempfile.mkdtemp(prefix='compgraph-aggregate-')
+                            files = [open(os.path.join(directory, str(i)), 'wb') for i in range(self.partitions)]
+                        spill_groups(groups, files)
+                        groups = {}
+                    group = ({column: row[column] for column in self.keys}, reducer.initial())
+                groups[key] = (group[0], reducer.accumulate(group[1], row))
+
+            if directory is None:
+                yield from self._finalize(groups)
+                return
+
+            spill_groups(groups, files)
+            groups = {}
+            for file in files:
+                file.close()
+            yield from merge_runs(self._merge_partition(os.path.join(directory, str(i)), directory)
+                                  for i in range(self.partitions))
+        finally:
+            for file in files:
+                file.close()
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def _finalize(self, groups: TGroups) -> ops.TRowsGenerator:
+        """Rows of groups in order of encoded keys"""
+        for _, (key_values, state) in sorted(groups.items(), key=itemgetter(0)):
+            yield from self.reducer.finalize(key_values, state)
+
+    def _merge_partition(self, path: str, directory: str) -> tp.Generator[tuple[bytes, ops.TRow], None, None]:
+        """Merge partial states of groups of partition and spill finalized rows as a sorted run"""
+        groups: TGroups = {}
+        for key, key_values, state in read_groups(path):
+            group = groups.get(key)
+            groups[key] = (key_values, state) if group is None else (group[0], self.reducer.merge(group[1], state))
+        os.remove(path)
+
+        run = write_run(list(self._finalize(groups)), self.keys, directory, compress=False)
+        return read_run(run, compress=False)
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return self.keys
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        if not self.keys:
+            return self.reducer.rows_per_group
+        return None
+
+    def describe(self) -> str:
+        return f'hash aggregate {type(self.reducer).__name__} by {ops.describe_keys(self.keys)}'
+
+
+class PartialAggregate(ops.Operation):
+    """
+    Map-side combine before sort: consecutive rows are aggregated into partial states
+    of their groups, a row per group holding key values and the state
+    is emitted whenever there are more than max_groups groups and in the end.
+    Rows of a group keep their order, so a stable sort and MergeAggregate
+    give the same result as sort and reduce of the original rows
+    """
+    batch_native = True
+
+    def __init__(
+        self, reducer: ops.CombinableReducer, keys: tp.Sequence[str], max_groups: int = COMBINE_MAX_GROUPS
+    ) -> None:
+        """
+        :param reducer: combinable reducer to use
+        :param keys: keys for grouping
+        :param max_groups: number of groups to keep partial states of
+        """
+        self.reducer = reducer
+        self.keys = tuple(keys)
+        self.max_groups = max_groups
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        yield from ops.unbatched(self.call_batches(ops.batched(rows)))
+
+    def call_batches(self, *inputs: ops.TBatchesIterable, **kwargs: tp.Any) -> ops.TBatchesGenerator:
+        row_key = ops.row_key(self.keys)
+        reducer = self.reducer
+        groups: TGroups = {}
+        for batch in inputs[0]:
+            for row in batch:
+                key = row_key(row)
+                group = groups.get(key)
+                if group is None:
+                    if len(groups) >= self.max_groups:
+                        yield from ops.batched(self._partial_rows(groups))
+                        groups = {}
+                    group = ({column: row[column] for column in self.keys}, reducer.initial())
+                groups[key] = (group[0], reducer.accumulate(group[1], row))
+
+        yield from ops.batched(self._partial_rows(groups))
+
+    @staticmethod
+    def _partial_rows(groups: TGroups) -> ops.TRowsGenerator:
+        for key_values, state in groups.values():
+            yield dict(key_values, **{STATE_COLUMN: state})
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        return inputs[0]
+
+    def describe(self) -> str:
+        return f'partial aggregate {type(self.reducer).__name__} by {ops.describe_keys(self.keys)}'
+
+
+class MergeAggregate(ops.Operation):
+    """Reduce of partial states made by PartialAggregate, sorted by keys"""
+
+    def __init__(self, reducer: ops.CombinableReducer, keys: tp.Sequence[str]) -> None:
+        """
+        :param reducer: combinable reducer partial states were made by
+        :param keys: keys for grouping
+        """
+        self.reducer = reducer
+        self.keys = tuple(keys)
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        for _, partials in itertools.groupby(rows, key=ops.row_key(self.keys)):
+            first = next(partials)
+            state = first[STATE_COLUMN]
+            for partial in partials:
+                state = self.reducer.merge(state, partial[STATE_COLUMN])
+            yield from self.reducer.finalize({column: first[column] for column in self.keys}, state)
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        if self.keys and ops.starts_with(inputs[0], self.keys):
+            return self.keys
+        return ()
+
+    def describe(self) -> str:
+        return f'merge aggregate {type(self.reducer).__name__} by {ops.describe_keys(self.keys)}'
@@ -16,49 +16,55 @@ def read_graph(input_stream_name: str, from_file: bool) -> Graph:
 def PreparedGraph(
     input_stream_name: str,
     text_column: str,
-    from_file: bool
+    from_file: bool,
+    workers: int = 1
 ) -> Graph:
-    graph = read_graph(input_stream_name, from_file)
+    return prepare_text(read_graph(input_stream_name, from_file), text_column, workers)
 
+
+def prepare_text(graph: Graph, text_column: str, workers: int = 1) -> Graph:
+    """Normalizes text_column of graph rows and splits it to one word per row
+    :param workers: number of processes to normalize text in
+    """
     return graph \
-        .map(operations.FilterPunctuation(text_column)) \
-        .map(operations.LowerCase(text_column)) \
-        .map(operations.Split(text_column))
+        .map(operations.FilterPunctuation(text_column), workers) \
+        .map(operations.LowerCase(text_column), workers) \
+        .map(operations.Split(text_column), workers)
 
 
 def word_count_graph(
     input_stream_name: str, text_column: str = 'text',
-    count_column: str = 'count', from_file: bool = False
+    count_column: str = 'count', from_file: bool = False, workers: int = 1
 ) -> Graph:
     """Constructs graph which counts words in text_column of all rows passed"""
-    return PreparedGraph(input_stream_name, text_column, from_file) \
-        .sort([text_column]) \
-        .reduce(operations.Count(count_column), [text_column]) \
-        .sort([count_column, text_column])
+    return PreparedGraph(input_stream_name, text_column, from_file, workers) \
+        .aggregate(operations.Count(count_column), [text_column]) \
+        .sort([count_column, text_column], workers)
 
 
 def inverted_index_graph(
     input_stream_name: str, doc_column: str = 'doc_id',
     text_column: str = 'text', result_column: str = 'tf_idf',
-    from_file: bool = False
+    from_file: bool = False, workers: int = 1
 ) -> Graph:
     """Constructs graph which calculates td-idf for every word/document pair"""
 
-    doc_graph = read_graph(input_stream_name, from_file) \
-        .reduce(operations.Count('docs_count'), [])
+    docs = read_graph(input_stream_name, from_file)
+
+    doc_graph = docs.reduce(operations.Count('docs_count'), [])
 
-    words_graph = PreparedGraph(input_stream_name, text_column, from_file)
+    words_graph = prepare_text(docs, text_column, workers)
 
     idf = words_graph.sort([doc_column, text_column]) \
-        .reduce(operations.FirstReducer(), [doc_column, text_column]) \
+        .reduce(operations.FirstReducer(), [doc_column, text_column], workers) \
         .sort([text_column]) \
-        .reduce(operations.Count('docs_for_word'), [text_column]) \
+        .reduce(operations.Count('docs_for_word'), [text_column], workers) \
         .join(operations.InnerJoiner(), doc_graph, []) \
         .map(operations.FractionLog(['docs_count', 'docs_for_word'], 'idf'))
 
     return words_graph.sort([doc_column]) \
-        .reduce(operations.TermFrequency(text_column), [doc_column]) \
-        .sort([text_column]) \
+        .reduce(operations.TermFrequency(text_column), [doc_column], workers) \
+        .sort([text_column], workers) \
         .join(operations.InnerJoiner(), idf, [text_column]) \
         .map(operations.Product(['tf', 'idf'], result_column)) \
         .reduce(operations.TopN(result_column, 3), [text_column]) \
@@ -69,7 +75,8 @@ def inverted_index_graph(
 def pmi_graph(
     input_stream_name: str, doc_column: str = 'doc_id',
     text_column: str = 'text', result_column: str = 'pmi', top_words: int = 10,
-    min_len: int = 4, min_occur: int = 2, from_file: bool = False
+    min_len: int = 4, min_occur: int = 2, from_file: bool = False,
+    workers: int = 1
 ) -> Graph:
 
     """
@@ -77,27 +84,27 @@ def pmi_graph(
     ranked by pointwise mutual information
     """
 
-    words_graph = PreparedGraph(input_stream_name, text_column, from_file) \
+    words_graph = PreparedGraph(input_stream_name, text_column, from_file, workers) \
         .map(operations.Filter(lambda r: len(r[text_column]) > min_len)) \
         .sort([doc_column, text_column]) \
-        .reduce(operations.Count('words_doc'), [doc_column, text_column]) \
+        .reduce(operations.Count('words_doc'), [doc_column, text_column], workers) \
         .map(operations.Filter(lambda r: r['words_doc'] >= min_occur))
 
     word_i = words_graph.sort([text_column]) \
-        .reduce(operations.Sum('words_doc'), [text_column]) \
+        .reduce(operations.Sum('words_doc'), [text_column], workers) \
         .map(operations.CopyWithDelete('words_doc', 'word_i'))
 
     doc_j = words_graph.sort([doc_column]) \
-        .reduce(operations.Sum('words_doc'), [doc_column]) \
+        .reduce(operations.Sum('words_doc'), [doc_column], workers) \
         .map(operations.CopyWithDelete('words_doc', 'doc_j'))
 
     total = words_graph.reduce(operations.Sum('words_doc'), []) \
         .map(operations.CopyWithDelete('words_doc', 'total'))
 
-    log = words_graph.sort([text_column]) \
+    log = words_graph.sort([text_column], workers) \
         .join(operations.InnerJoiner(), word_i, [text_column]) \
         .join(operations.InnerJoiner(), total, []) \
-        .sort([doc_column]) \
+        .sort([doc_column], workers) \
         .join(operations.InnerJoiner(), doc_j, [doc_column]) \
         .map(operations.Product(['words_doc', 'total'], 'total_words_doc')) \
         .map(operations.Product(['doc_j', 'word_i'], 'doc_j_word_i')) \
@@ -107,7 +114,7 @@ def pmi_graph(
         ))
 
     return log.sort([doc_column, result_column]) \
-        .reduce(operations.TopN(result_column, top_words), [doc_column]) \
+        .reduce(operations.TopN(result_column, top_words), [doc_column], workers) \
         .map(operations.Project([doc_column, text_column, result_column]))
 
 
@@ -120,7 +127,8 @@ def yandex_maps_graph(
     weekday_result_column: str = 'weekday',
     hour_result_column: str = 'hour',
     speed_result_column: str = 'speed',
-    time_format: str = '%Y%m%dT%H%M%S.%f', from_file: bool = False
+    time_format: str = '%Y%m%dT%H%M%S.%f', from_file: bool = False,
+    workers: int = 1
 ) -> Graph:
     """
     Constructs graph which measures average speed in km/h
@@ -132,9 +140,9 @@ def yandex_maps_graph(
             [start_coord_column, end_coord_column],
             'length'
         )) \
-        .sort([edge_id_column])
+        .sort([edge_id_column], workers)
 
-    time = read_graph(input_stream_name_time, from_file) \
+    return read_graph(input_stream_name_time, from_file) \
         .map(operations.Strptime(
             [enter_time_column], time_format, 'enter_date'
         )).map(operations.Strptime(
@@ -145,39 +153,18 @@ def yandex_maps_graph(
             ['enter_date'], '%a', weekday_result_column
         )).map(operations.Strftime(
             ['enter_date'], '%H', hour_result_column
-        )).sort([edge_id_column]) \
-        .map(operations.CalcHours(
+        )).map(operations.CalcHours(
             ['enter_date', 'leave_date'], 'time'
         )).map(operations.Project(
-            [weekday_result_column, hour_result_column, 'time']
-        )).sort([weekday_result_column, hour_result_column]) \
-        .reduce(
-            operations.Sum('time'),
-            [weekday_result_column, hour_result_column]
-        )
-
-    distance = read_graph(input_stream_name_time, from_file) \
-        .map(operations.Strptime(
-            [enter_time_column], time_format, 'enter_date'
-        )).map(operations.Strftime(
-            ['enter_date'], '%a', weekday_result_column
-        )).map(operations.Strftime(
-            ['enter_date'], '%H', hour_result_column
-        )).map(operations.Project(
-            [weekday_result_column, hour_result_column, edge_id_column]
-        )).sort([edge_id_column]) \
-        .join(operations.InnerJoiner(), length, [edge_id_column]) \
+            [weekday_result_column, hour_result_column, edge_id_column, 'time']
+        )).sort([edge_id_column], workers) \
+        .join(operations.InnerJoiner(), length, [edge_id_column], semi_join=True) \
         .sort([weekday_result_column, hour_result_column]) \
         .reduce(
-            operations.Sum('length'),
-            [weekday_result_column, hour_result_column]
-        )
-
-    return distance.join(
-        operations.InnerJoiner(),
-        time, [weekday_result_column, hour_result_column]
-    ).map(operations.Divide(
-        ['length', 'time'], speed_result_column
-    )).map(operations.Project(
-        [weekday_result_column, hour_result_column, speed_result_column]
-    ))
+            operations.Aggregate(length=operations.Sum('length'), time=operations.Sum('time')),
+            [weekday_result_column, hour_result_column], workers
+        ).map(operations.Divide(
+            ['length', 'time'], speed_result_column
+        )).map(operations.Project(
+            [weekday_result_column, hour_result_column, speed_result_column]
+        ))
@@ -1,53 +1,380 @@
+import atexit
+import gzip
+import heapq
+import itertools
+import os
+import pickle
+import shutil
+import tempfile
+import threading
 import typing as tp
 
-from multiprocessing import Pipe, Process, connection
+from collections import deque
+from multiprocessing import Pipe, Pool, Process, connection
+from multiprocessing.pool import AsyncResult
 from operator import itemgetter
+from queue import Full, Queue
 
 from . import operations as ops
 
 
-def do_sort(endpoint: connection.Connection, keys: tuple[str, ...]) -> None:
-    rows = []
+MEMORY_LIMIT = 256 * 2 ** 20
+RUN_CHUNK_SIZE = 1024
+IPC_CHUNK_SIZE = 4096
+PARALLEL_SORT_MIN_ROWS = 10000
+PREFETCH_DEPTH = 2
+MAX_IDLE_SORTERS = 4
+SHUTDOWN_TIMEOUT = 5
+
+T = tp.TypeVar('T')
+
+
+class _Failure:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+_DONE = object()
+
+
+def prefetch(items: tp.Iterable[T], depth: int = PREFETCH_DEPTH) -> tp.Generator[T, None, None]:
+    """Iterate items in a background thread keeping up to depth of them ready,
+    so producing next items (e.g. receiving them from a pipe) overlaps with consuming
+    """
+    queue: Queue[tp.Any] = Queue(depth)
+    stopped = threading.Event()
+
+    def put(item: tp.Any) -> bool:
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as error:
+            put(_Failure(error))
+        else:
+            put(_DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+
+
+def receive_chunks(endpoint: connection.Connection) -> tp.Generator[list[ops.TRow], None, None]:
+    """Chunks of rows sent to endpoint until None"""
     while True:
-        row = endpoint.recv()
-        if row is None:
+        chunk = endpoint.recv()
+        if chunk is None:
             break
-        rows.append(row)
-    rows.sort(key=itemgetter(*keys))
+        yield chunk
+
+
+def write_run(rows: list[ops.TRow], keys: tuple[str, ...], directory: str, compress: bool) -> str:
+    """Write sorted rows to a new file in directory as pickled chunks of (encoded key, row) pairs,
+    so the runs are merged comparing bytes only
+    :return: file name
+    """
+    row_key = ops.row_key(keys)
+    fd, path = tempfile.mkstemp(prefix='run-', dir=directory)
+    with os.fdopen(fd, 'wb') as raw, (gzip.open(raw, 'wb', compresslevel=1) if compress else raw) as f:
+        for start in range(0, len(rows), RUN_CHUNK_SIZE):
+            chunk = rows[start:start + RUN_CHUNK_SIZE]
+            pickle.dump(list(zip(map(row_key, chunk), chunk)), f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def read_run(path: str, compress: bool) -> tp.Generator[tuple[bytes, ops.TRow], None, None]:
+    with (gzip.open(path, 'rb') if compress else open(path, 'rb')) as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                break
+            yield from chunk
+
+
+def split_runs(
+    rows: ops.TRowsIterable, memory_limit: int
+) -> tp.Generator[tuple[list[ops.TRow], bool], None, None]:
+    """Split rows into consecutive runs taking up to memory_limit bytes each (estimated)
+    :return: runs together with flag telling if the run is the last one
+    """
+    run: list[ops.TRow] = []
+    sample_size, sample_count = 0, 0
     for row in rows:
-        endpoint.send(row)
+        run.append(row)
+        if len(run) % ops.SIZE_SAMPLE_RATE == 1:
+            sample_size += ops.row_size(row)
+            sample_count += 1
+        if len(run) * sample_size > memory_limit * sample_count:
+            yield run, False
+            run = []
+
+    yield run, True
+
+
+def sort_run(rows: list[ops.TRow], keys: tuple[str, ...], directory: str, compress: bool) -> str:
+    """Sort rows and spill them to directory, run in sort workers
+    :return: file name
+    """
+    return write_run(ops.sort_rows(rows, keys), keys, directory, compress)
+
+
+def merge_runs(runs: tp.Iterable[tp.Iterable[tuple[bytes, ops.TRow]]]) -> ops.TRowsGenerator:
+    """Merge runs of (encoded key, row) pairs, on equal keys earlier runs go first"""
+    for _, row in heapq.merge(*runs, key=itemgetter(0)):
+        yield row
+
+
+def sort_keyed_run(rows: list[ops.TRow], keys: tuple[str, ...]) -> list[tuple[bytes, ops.TRow]]:
+    """Sort rows in memory, run in sort workers
+    :return: (encoded key, row) pairs to merge
+    """
+    rows = ops.sort_rows(rows, keys)
+    return list(zip(map(ops.row_key(keys), rows), rows))
+
+
+def sort_in_memory(rows: list[ops.TRow], keys: tuple[str, ...], workers: int = 1) -> ops.TRowsIterable:
+    """Sort rows which fit into memory. With several workers, free processors and enough rows
+    consecutive slices of rows are sorted by a pool of processes and merged in memory
+    (shipping rows to workers and back costs about as much as sorting them, so it pays off
+    only when the slices are really sorted at the same time)
+    """
+    workers = min(workers, os.cpu_count() or 1)
+    if workers == 1 or len(rows) < PARALLEL_SORT_MIN_ROWS:
+        return ops.sort_rows(rows, keys)
+
+    size = -(-len(rows) // workers)
+    with Pool(workers) as pool:
+        runs = pool.starmap(sort_keyed_run, [(rows[start:start + size], keys) for start in range(0, len(rows), size)])
+    return merge_runs(runs)
+
+
+def sort_with_spills(
+    rows: ops.TRowsIterable, keys: tuple[str, ...],
+    memory_limit: int, directory: str, compress: bool, workers: int = 1
+) -> ops.TRowsIterable:
+    """Sort rows in memory if they fit into memory limit, otherwise split them into
+    sorted runs spilled to disk (all but the last one) and merge the runs.
+    With several workers rows fitting into memory are sorted in parallel slices,
+    larger inputs are split into runs of worker's share of the memory limit
+    which a pool of processes sorts and spills while the next runs are read.
+    Runs are merged in order of input, so the sort is stable
+    """
+    runs = split_runs(rows, memory_limit // workers)
+    held: list[list[ops.TRow]] = []
+    for run, last in runs:
+        if last:
+            return sort_in_memory(list(itertools.chain.from_iterable(held + [run])), keys, workers)
+        held.append(run)
+        if len(held) == workers:
+            break
+
+    paths = []
+    spilled = itertools.chain(((run, False) for run in held), runs)
+    if workers == 1:
+        for run, last in spilled:
+            if last:
+                break
+            paths.append(sort_run(run, keys, directory, compress))
+        run = ops.sort_rows(run, keys)
+    else:
+        pending: deque[AsyncResult[str]] = deque()
+        with Pool(workers) as pool:
+            for run, last in spilled:
+                if last:
+                    break
+                if len(pending) >= workers:
+                    paths.append(pending.popleft().get())
+                pending.append(pool.apply_async(sort_run, (run, keys, directory, compress)))
+            run = ops.sort_rows(run, keys)
+            paths.extend(result.get() for result in pending)
+
+    return merge_runs([read_run(path, compress) for path in paths] + [zip(map(ops.row_key(keys), run), run)])
+
+
+def do_sort(
+    endpoint: connection.Connection, keys: tuple[str, ...], directory: str,
+    memory_limit: int = MEMORY_LIMIT, compress: bool = False, workers: int = 1
+) -> None:
+    """Sort rows sent to endpoint and send them back, spilling runs to directory.
+    The directory is owned by the sending process, which removes it
+    even when the sorter is killed in the middle of the job
+    """
+    rows = ops.unbatched(prefetch(receive_chunks(endpoint)))
+    merged = sort_with_spills(rows, keys, memory_limit, directory, compress, workers)
+    for chunk in ops.batched(merged, IPC_CHUNK_SIZE):
+        endpoint.send(chunk)
     endpoint.send(None)
 
 
+def serve_sorts(endpoint: connection.Connection) -> None:
+    """Sorter process loop: run sort jobs one after another until None is sent instead of job"""
+    while True:
+        job = endpoint.recv()
+        if job is None:
+            break
+        do_sort(endpoint, *job)
+
+
+class Sorter:
+    """Sorter process with a pipe to send it sort jobs"""
+
+    def __init__(self) -> None:
+        self.endpoint, remote_endpoint = Pipe()
+        self.process = Process(target=serve_sorts, args=(remote_endpoint,))
+        self.process.start()
+
+    def stop(self, terminate: bool = False) -> None:
+        """Let sorter finish (or kill it if it is in the middle of a job) and wait for it"""
+        if self.process.is_alive() and not terminate:
+            try:
+                self.endpoint.send(None)
+                self.process.join(SHUTDOWN_TIMEOUT)
+            except OSError:
+                pass
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+
+class SorterPool:
+    """
+    Sorter processes shared by all sorts. Sorters are started lazily,
+    a sorter which finished its job waits for the next one, idle sorters
+    above max_idle are stopped. The pool is shut down at interpreter exit
+    """
+
+    def __init__(self, max_idle: int = MAX_IDLE_SORTERS) -> None:
+        """
+        :param max_idle: number of idle sorters to keep
+        """
+        self.max_idle = max_idle
+        self.started = 0
+        self._idle: list[Sorter] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        atexit.register(self.shutdown)
+
+    def acquire(self) -> Sorter:
+        """Idle sorter or a new one if there is none"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle, self._pid = [], os.getpid()
+            while self._idle:
+                sorter = self._idle.pop()
+                if sorter.process.is_alive():
+                    return sorter
+            self.started += 1
+        return Sorter()
+
+    def release(self, sorter: Sorter, finished: bool) -> None:
+        """Take sorter back
+        :param finished: sorter finished its job, otherwise it is killed
+        """
+        with self._lock:
+            if finished and len(self._idle) < self.max_idle and self._pid == os.getpid():
+                self._idle.append(sorter)
+                return
+        sorter.stop(terminate=not finished)
+
+    def shutdown(self) -> None:
+        """Stop idle sorters"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        if self._pid == os.getpid():
+            for sorter in idle:
+                sorter.stop()
+
+
+sorters = SorterPool()
+
+
 class ExternalSort(ops.Operation):
     """
     In order to not account materialization during sorting
     in main process memory consumption, we delegate
     sorting to a separate process.
+    The sorter keeps at most memory_limit bytes of rows (estimated),
+    larger inputs are spilled to disk as sorted runs which
+    are merged while streaming rows back. With several workers
+    the runs are sorted in parallel by a pool of sorter's child processes.
+    Rows travel through the pipe in chunks, the next chunk is received
+    in a background thread while the previous one is processed.
+    Sorter processes are taken from a pool shared by all sorts and runs.
     This class illustrates cross-process streaming.
     """
+    spawns_process = True
+    batch_native = True
+
+    def __init__(
+        self, keys: tp.Sequence[str], memory_limit: int = MEMORY_LIMIT,
+        compress: bool = False, workers: int = 1
+    ):
+        """
+        :param keys: sorting keys
+        :param memory_limit: approximate number of bytes of rows sorter keeps in memory
+        :param compress: compress runs spilled to disk
+        :param workers: number of processes sorting runs
+        """
+        if workers < 1:
+            raise ValueError('number of workers has to be positive')
 
-    def __init__(self, keys: tp.Sequence[str]):
         self.keys = keys
+        self.memory_limit = memory_limit
+        self.compress = compress
+        self.workers = workers
 
     def __call__(
         self, rows: ops.TRowsIterable,
         *args: tp.Any, **kwargs: tp.Any
     ) -> ops.TRowsGenerator:
-        local_endpoint, remote_endpoint = Pipe()
-        process = Process(target=do_sort, args=(remote_endpoint, self.keys))
-        process.start()
-        row_count_before = 0
-        for row in rows:
-            local_endpoint.send(row)
-            row_count_before += 1
-        local_endpoint.send(None)
-        row_count_after = 0
-        while True:
-            local_endpoint_row = local_endpoint.recv()
-            if local_endpoint_row is None:
-                break
-            yield local_endpoint_row
-            row_count_after += 1
-        assert row_count_before == row_count_after
-        process.join()
+        yield from ops.unbatched(self.call_batches(ops.batched(rows, IPC_CHUNK_SIZE)))
+
+    def call_batches(self, *inputs: ops.TBatchesIterable, **kwargs: tp.Any) -> ops.TBatchesGenerator:
+        sorter = sorters.acquire()
+        directory = tempfile.mkdtemp(prefix='compgraph-sort-')
+        finished = False
+        try:
+            sorter.endpoint.send((tuple(self.keys), directory, self.memory_limit, self.compress, self.workers))
+            row_count_before = 0
+            for batch in inputs[0]:
+                sorter.endpoint.send(batch)
+                row_count_before += len(batch)
+            sorter.endpoint.send(None)
+            row_count_after = 0
+            for chunk in prefetch(receive_chunks(sorter.endpoint)):
+                yield chunk
+                row_count_after += len(chunk)
+            assert row_count_before == row_count_after
+            finished = True
+        finally:
+            sorters.release(sorter, finished)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return tuple(self.keys)
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        return inputs[0]
+
+    def describe(self) -> str:
+        workers = f' with {self.workers} workers' if self.workers > 1 else ''
+        return f'sort by {ops.describe_keys(self.keys)} in sorter process{workers}'
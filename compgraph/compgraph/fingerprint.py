@@ -0,0 +1,217 @@
+import functools
+import hashlib
+import json
+import os
+import pickle
+import sys
+import sysconfig
+import types
+import typing as tp
+
+from . import operations as ops
+
+if tp.TYPE_CHECKING:  # pragma: no cover
+    from .graph import Graph
+
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+# Modules whose objects are described by qualified name only: their code is versioned
+# with the installation, module level state (pools of processes, caches) is not data
+LIBRARY_PATHS = tuple(
+    os.path.realpath(sysconfig.get_paths()[name]) + os.sep for name in ('stdlib', 'platstdlib', 'purelib', 'platlib')
+)
+PACKAGE = __name__.partition('.')[0]
+
+_BUILTIN_CALLABLES = (
+    types.BuiltinFunctionType, types.MethodDescriptorType, types.WrapperDescriptorType,
+    types.MethodWrapperType, types.ClassMethodDescriptorType
+)
+# attributes of user classes which are the same for every class
+_CLASS_SPECIALS = {'__dict__', '__weakref__', '__doc__', '__module__', '__qualname__', '__annotations__'}
+
+
+class UndescribableError(TypeError):
+    """Object has no stable description, outputs depending on it can not be reused"""
+
+
+def is_library(module_name: tp.Optional[str]) -> bool:
+    """Module is a part of this package, of standard library or of an installed package"""
+    if module_name is None:
+        return False
+    top = module_name.partition('.')[0]
+    if top in (PACKAGE, 'builtins') or top in sys.stdlib_module_names:
+        return True
+    filename = getattr(sys.modules.get(module_name), '__file__', None)
+    return filename is not None and os.path.realpath(filename).startswith(LIBRARY_PATHS)
+
+
+def global_names(code: types.CodeType) -> set[str]:
+    """Names code and code nested in it may read from globals"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= global_names(const)
+    return names
+
+
+def describe_object(obj: tp.Any, seen: tp.Optional[set[int]] = None) -> str:
+    """
+    Stable textual description of operation parts (mappers, reducers, parsers, lambdas...)
+    which does not depend on object addresses, so it is the same in every process.
+    Functions are described by code, defaults, closure and globals they read,
+    bound methods and partials by their functions and bound objects and arguments;
+    functions and classes of libraries by qualified name only
+    :raises UndescribableError: for objects without stable description (iterators, files...)
+    """
+    seen = set() if seen is None else seen
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        return repr(obj)
+    if id(obj) in seen:
+        return '<cycle>'
+    seen = seen | {id(obj)}
+
+    if isinstance(obj, (list, tuple)):
+        return type(obj).__name__ + '(' + ', '.join(describe_object(item, seen) for item in obj) + ')'
+    if isinstance(obj, (set, frozenset)):
+        return type(obj).__name__ + '(' + ', '.join(sorted(describe_object(item, seen) for item in obj)) + ')'
+    if isinstance(obj, dict):
+        items = sorted(f'{describe_object(key, seen)}: {describe_object(value, seen)}' for key, value in obj.items())
+        return '{' + ', '.join(items) + '}'
+    if isinstance(obj, types.ModuleType):
+        return f'module {obj.__name__}'
+    if isinstance(obj, functools.partial):
+        return f'partial {describe_object(obj.func, seen)} args {describe_object(obj.args, seen)} ' \
+            f'keywords {describe_object(obj.keywords, seen)}'
+    if isinstance(obj, types.FunctionType):
+        name = f'function {obj.__module__}.{obj.__qualname__}'
+        if is_library(obj.__module__):
+            return name
+        closure = [cell.cell_contents for cell in obj.__closure__ or ()]
+        used_globals = {
+            key: obj.__globals__[key] for key in global_names(obj.__code__) if key in obj.__globals__
+        }
+        return f'{name} {describe_object(obj.__code__, seen)} defaults {describe_object(obj.__defaults__, seen)} ' \
+            f'{describe_object(obj.__kwdefaults__, seen)} closure {describe_object(closure, seen)} ' \
+            f'globals {describe_object(used_globals, seen)}'
+    if isinstance(obj, types.CodeType):
+        return f'code {obj.co_code.hex()} {describe_object(obj.co_consts, seen)} {obj.co_names}'
+    if isinstance(obj, types.MethodType):
+        return f'method {describe_object(obj.__func__, seen)} of {describe_object(obj.__self__, seen)}'
+    if isinstance(obj, _BUILTIN_CALLABLES):
+        module = getattr(obj, '__module__', None)
+        name = f'{module}.{obj.__qualname__}' if module else obj.__qualname__
+        bound = getattr(obj, '__self__', None)
+        if bound is None or isinstance(bound, (types.ModuleType, type)):
+            return name
+        return f'{name} of {describe_object(bound, seen)}'
+    if isinstance(obj, (staticmethod, classmethod)):
+        return f'{type(obj).__name__} {describe_object(obj.__func__, seen)}'
+    if isinstance(obj, property):
+        return f'property {describe_object([obj.fget, obj.fset, obj.fdel], seen)}'
+    if isinstance(obj, type):
+        name = f'{obj.__module__}.{obj.__qualname__}'
+        if is_library(obj.__module__):
+            return name
+        members = {key: value for key, value in vars(obj).items() if key not in _CLASS_SPECIALS}
+        return f'class {name}{describe_object(obj.__bases__, seen)}{describe_object(members, seen)}'
+
+    attributes = getattr(obj, '__dict__', None)
+    slots = [
+        (slot, getattr(obj, slot)) for cls in type(obj).__mro__ for slot in getattr(cls, '__slots__', ())
+        if slot not in ('__dict__', '__weakref__') and hasattr(obj, slot)
+    ]
+    if attributes is not None or slots:
+        return f'{describe_object(type(obj), seen)}{describe_object(attributes or {}, seen)}' \
+            f'{describe_object(slots, seen)}'
+
+    try:
+        data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    except Exception as error:
+        raise UndescribableError(f'can not describe {type(obj).__qualname__} object') from error
+    return f'{describe_object(type(obj), seen)} pickled {hashlib.sha256(data).hexdigest()}'
+
+
+class InputHashes:
+    """
+    Content hashes of input files. A file is hashed again only
+    when its size or modification time changes; hashes may be kept
+    in a json file to be reused by next runs
+    """
+
+    def __init__(self, path: tp.Optional[str] = None) -> None:
+        """
+        :param path: json file to load hashes from and save them to
+        """
+        self.path = path
+        self._hashes: dict[str, tuple[int, int, str]] = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self._hashes = {filename: tuple(state) for filename, state in json.load(f).items()}
+
+    def __call__(self, filename: str) -> str:
+        """Hash of file contents"""
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        state = self._hashes.get(filename)
+        if state is not None and state[:2] == (stat.st_size, stat.st_mtime_ns):
+            return state[2]
+
+        content_hash = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                content_hash.update(chunk)
+        self._hashes[filename] = (stat.st_size, stat.st_mtime_ns, content_hash.hexdigest())
+
+        if self.path is not None:
+            with open(self.path, 'w') as f:
+                json.dump(self._hashes, f)
+        return content_hash.hexdigest()
+
+
+input_hashes = InputHashes()
+
+
+def operation_fingerprint(operation: ops.Operation, hashes: InputHashes = input_hashes) -> tp.Optional[str]:
+    """Fingerprint of operation definition and, for sources, of their data.
+    :param hashes: content hashes of input files
+    :return: None for sources which can not be fingerprinted (row iterators)
+        and for operations with parts which can not be described
+    """
+    if isinstance(operation, ops.ReadIterFactory):
+        return None
+
+    try:
+        description = describe_object(operation)
+    except UndescribableError:
+        return None
+    if isinstance(operation, ops.Read):
+        description += hashes(operation.filename)
+    return description
+
+
+def graph_fingerprints(graph: 'Graph', hashes: InputHashes = input_hashes) -> dict['Graph', tp.Optional[str]]:
+    """Hashes of definitions of graph and all graphs it reads from together with their input files.
+    :param hashes: content hashes of input files
+    :return: fingerprint of every node, None for nodes depending on row iterators
+    """
+    fingerprints: dict[Graph, tp.Optional[str]] = {}
+    stack = [graph]
+    while stack:
+        node = stack[-1]
+        children = [child for child in (node.main_graph, node.another_graph) if child is not None]
+        pending = [child for child in children if child not in fingerprints]
+        if pending:
+            stack.extend(pending)
+            continue
+
+        stack.pop()
+        assert node.operation is not None
+        parts = [operation_fingerprint(node.operation, hashes)] + [fingerprints[child] for child in children]
+        if any(part is None for part in parts):
+            fingerprints[node] = None
+        else:
+            fingerprints[node] = hashlib.sha256('\n'.join(tp.cast(list[str], parts)).encode()).hexdigest()
+
+    return fingerprints
@@ -1,7 +1,12 @@
 import typing as tp
 
 from . import operations as ops
+from compgraph.aggregate import HashAggregate
 from compgraph.external_sort import ExternalSort
+from compgraph.hash_join import HashJoin
+from compgraph.parallel import ParallelMap, ParallelReduce
+from compgraph.persist import Persist
+from compgraph.plan import Plan
 
 
 class Graph:
@@ -13,89 +18,164 @@ class Graph:
         self.another_graph: Graph | None = None
 
     @staticmethod
-    def graph_from_iter(name: str) -> 'Graph':
+    def graph_from_iter(name: str, sorted_by: tp.Sequence[str] = ()) -> 'Graph':
         """Construct new graph which reads data from row iterator
         (in form of sequence of Rows from 'kwargs' passed to 'run' method)
         into graph data-flow
         Use ops.ReadIterFactory
         :param name: name of kwarg to use as data source
+        :param sorted_by: keys the rows are known to be sorted by, sorts they satisfy are skipped
         """
         graph = Graph()
-        graph.operation = ops.ReadIterFactory(name)
+        graph.operation = ops.ReadIterFactory(name, sorted_by)
         return graph
 
     @staticmethod
     def graph_from_file(
-        filename: str, parser: tp.Callable[[str], ops.TRow]
+        filename: str, parser: tp.Callable[[str], ops.TRow],
+        sorted_by: tp.Sequence[str] = ()
     ) -> 'Graph':
         """Construct new graph extended with operation
         for reading rows from file
         Use ops.Read
         :param filename: filename to read from
         :param parser: parser from string to Row
+        :param sorted_by: keys the file is known to be sorted by, sorts they satisfy are skipped
         """
         graph = Graph()
-        graph.operation = ops.Read(filename, parser)
+        graph.operation = ops.Read(filename, parser, sorted_by)
         return graph
 
-    def map(self, mapper: ops.Mapper) -> 'Graph':
+    def map(self, mapper: ops.Mapper, workers: int = 1, ordered: bool = True) -> 'Graph':
         """Construct new graph extended with map operation
         with particular mapper
         :param mapper: mapper to use
+        :param workers: number of processes to map in, batches of rows are shipped to them
+        :param ordered: keep order of rows when mapping in several processes
         """
         graph = Graph()
-        graph.operation = ops.Map(mapper)
+        graph.operation = ops.Map(mapper) if workers == 1 else ParallelMap([mapper], workers, ordered=ordered)
         graph.main_graph = self
 
         return graph
 
-    def reduce(self, reducer: ops.Reducer, keys: tp.Sequence[str]) -> 'Graph':
+    def reduce(self, reducer: ops.Reducer, keys: tp.Sequence[str], workers: int = 1) -> 'Graph':
         """Construct new graph extended with reduce
         operation with particular reducer
         :param reducer: reducer to use
         :param keys: keys for grouping
+        :param workers: number of processes to run directly preceding sort and this reduce in,
+            rows are hash-partitioned between them by keys
         """
         graph = Graph()
-        graph.operation = ops.Reduce(reducer, keys)
+        graph.operation = ops.Reduce(reducer, keys) if workers == 1 else ParallelReduce(reducer, keys, workers)
         graph.main_graph = self
 
         return graph
 
-    def sort(self, keys: tp.Sequence[str]) -> 'Graph':
+    def aggregate(self, reducer: ops.CombinableReducer, keys: tp.Sequence[str]) -> 'Graph':
+        """Construct new graph extended with reduce of unsorted rows in a hash table,
+        spilled to disk when there are too many groups.
+        Rows are the same as of 'sort' and 'reduce' by keys, in the same order
+        :param reducer: combinable reducer to use
+        :param keys: keys for grouping
+        """
+        graph = Graph()
+        graph.operation = HashAggregate(reducer, keys)
+        graph.main_graph = self
+
+        return graph
+
+    def sort(self, keys: tp.Sequence[str], workers: int = 1) -> 'Graph':
         """Construct new graph extended with sort operation
         :param keys: sorting keys (typical is tuple of strings)
+        :param workers: number of processes to sort runs of rows in, runs are merged afterwards
         """
         graph = Graph()
-        graph.operation = ExternalSort(keys)
+        graph.operation = ExternalSort(keys, workers=workers)
+        graph.main_graph = self
+
+        return graph
+
+    def limit(self, n: int) -> 'Graph':
+        """Construct new graph extended with operation taking first n rows;
+        the rest of input is not computed. Sort directly followed by limit
+        keeps only n rows in memory instead of sorting everything
+        :param n: number of rows to take
+        """
+        graph = Graph()
+        graph.operation = ops.Limit(n)
         graph.main_graph = self
 
         return graph
 
     def join(
         self, joiner: ops.Joiner,
-        join_graph: 'Graph', keys: tp.Sequence[str]
+        join_graph: 'Graph', keys: tp.Sequence[str], semi_join: bool = False
     ) -> 'Graph':
         """Construct new graph extended with join operation with another graph
         :param joiner: join strategy to use
         :param join_graph: other graph to join with
         :param keys: keys for grouping
+        :param semi_join: before sorting the input which unmatched rows the joiner drops
+            (left one for inner and right joins, right one for left join)
+            filter it by keys of the other input, collected in advance
         """
         graph = Graph()
-        graph.operation = ops.Join(joiner, keys)
+        graph.operation = ops.Join(joiner, keys, semi_join)
         graph.main_graph = self
         graph.another_graph = join_graph
 
         return graph
 
-    def run(self, **kwargs: tp.Any) -> ops.TRowsIterable:
-        """Single method to start execution; data sources passed as kwargs"""
-        if self.main_graph is None:
-            return self.operation(**kwargs)  # type: ignore
+    def persist(self, path: str | None = None) -> 'Graph':
+        """Construct new graph extended with checkpoint of rows on local disk.
+        Rows are computed once and replayed from the file by all consumers;
+        later runs replay the file given by path too until the graph or its input files change
+        :param path: file to keep rows in, by default a private temporary file used by one run only
+        """
+        graph = Graph()
+        graph.operation = Persist(path)
+        graph.main_graph = self
+
+        return graph
 
-        if self.another_graph is None:
-            return self.operation(self.main_graph.run(**kwargs))  # type: ignore
+    def hash_join(
+        self, joiner: ops.Joiner,
+        join_graph: 'Graph', keys: tp.Sequence[str]
+    ) -> 'Graph':
+        """Construct new graph extended with join operation with another graph
+        which does not need inputs sorted by keys: the smaller input is put
+        into a hash table, the other one is streamed through it.
+        Rows are the same as of 'join', but not sorted by keys
+        :param joiner: join strategy to use
+        :param join_graph: other graph to join with
+        :param keys: keys to join on
+        """
+        graph = Graph()
+        graph.operation = HashJoin(joiner, keys)
+        graph.main_graph = self
+        graph.another_graph = join_graph
+
+        return graph
+
+    def compile(self, cache_dir: str | None = None) -> Plan:
+        """Compile graph into physical plan of stages
+        :param cache_dir: directory to cache outputs of sorts, reduces and joins in;
+            on next runs they are reused while their definitions and input files stay the same
+        """
+        return Plan.from_graph(self, cache_dir)
 
-        return self.operation(  # type: ignore
-            self.main_graph.run(**kwargs),
-            self.another_graph.run(**kwargs)
-        )
+    def explain(self) -> None:
+        """Print physical plan which 'run' will execute:
+        stages, sort boundaries, process spawns and shared stages
+        """
+        print(self.compile().explain())
+
+    def run(self, **kwargs: tp.Any) -> ops.TRowsIterable:
+        """Single method to start execution; data sources passed as kwargs.
+        Subgraphs consumed by several branches are executed once per run,
+        their output is fanned out to consumers through a disk spool.
+        Incremental runs execute the plan of 'compile' with cache directory
+        """
+        return self.compile().execute(**kwargs)
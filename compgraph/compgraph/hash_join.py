@@ -0,0 +1,145 @@
+import itertools
+import os
+import pickle
+import shutil
+import tempfile
+import typing as tp
+
+from . import operations as ops
+from .external_sort import MEMORY_LIMIT
+
+
+PARTITIONS = 16
+PARTITION_CHUNK_SIZE = 1024
+
+TKeyedRows = tp.Iterable[tuple[bytes, ops.TRow]]
+
+
+def write_partitions(keyed_rows: TKeyedRows, paths: list[str]) -> list[int]:
+    """Spread (encoded key, row) pairs over partition files by hash of key
+    :return: number of rows in every partition
+    """
+    chunks: list[list[tuple[bytes, ops.TRow]]] = [[] for _ in paths]
+    counts = [0] * len(paths)
+    files = [open(path, 'wb') for path in paths]
+    try:
+        for key, row in keyed_rows:
+            partition = hash(key) % len(paths)
+            chunks[partition].append((key, row))
+            if len(chunks[partition]) >= PARTITION_CHUNK_SIZE:
+                pickle.dump(chunks[partition], files[partition], pickle.HIGHEST_PROTOCOL)
+                counts[partition] += len(chunks[partition])
+                chunks[partition] = []
+
+        for partition, chunk in enumerate(chunks):
+            pickle.dump(chunk, files[partition], pickle.HIGHEST_PROTOCOL)
+            counts[partition] += len(chunk)
+    finally:
+        for file in files:
+            file.close()
+
+    return counts
+
+
+def read_partition(path: str) -> tp.Generator[tuple[bytes, ops.TRow], None, None]:
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                break
+            yield from chunk
+
+
+class HashJoin(ops.Operation):
+    """
+    Join of unsorted inputs. Both inputs are read alternately until one of them ends,
+    rows of that (smaller) side are put to a hash table by encoded keys, the other side
+    is streamed through it. Build rows which matched nothing are joined with empty
+    group in the end, so joiners give the same rows as merge join does (in other order).
+    If both sides outgrow memory limit before one of them ends, the inputs are spilled
+    to disk partitioned by hash of keys and partitions are joined one by one
+    """
+
+    def __init__(
+        self, joiner: ops.Joiner, keys: tp.Sequence[str],
+        memory_limit: int = MEMORY_LIMIT, partitions: int = PARTITIONS
+    ) -> None:
+        """
+        :param joiner: join strategy to use
+        :param keys: keys to join on
+        :param memory_limit: approximate number of bytes of build rows to keep in memory
+        :param partitions: number of partitions to spill inputs to when they do not fit in memory
+        """
+        self.joiner = joiner
+        self.keys = tuple(keys)
+        self.memory_limit = memory_limit
+        self.partitions = partitions
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        row_key = ops.row_key(self.keys)
+        inputs = [iter(rows), iter(args[0])]
+        buffers: list[list[ops.TRow]] = [[], []]
+        sample_size, sample_count = 0, 0
+        while True:
+            for side in (0, 1):
+                row = next(inputs[side], None)
+                if row is None:
+                    build = ((row_key(row_), row_) for row_ in buffers[side])
+                    other = itertools.chain(buffers[1 - side], inputs[1 - side])
+                    probe = ((row_key(row_), row_) for row_ in other)
+                    yield from self._join(build, probe, build_is_left=side == 0)
+                    return
+                buffers[side].append(row)
+
+            if len(buffers[0]) % ops.SIZE_SAMPLE_RATE == 1:
+                sample_size += ops.row_size(buffers[0][-1]) + ops.row_size(buffers[1][-1])
+                sample_count += 2
+            if len(buffers[0]) * sample_size > self.memory_limit * sample_count:
+                break
+
+        yield from self._grace_join(
+            (itertools.chain(buffers.pop(0), inputs[0]), itertools.chain(buffers.pop(0), inputs[1])), row_key
+        )
+
+    def _join(self, build: TKeyedRows, probe: TKeyedRows, build_is_left: bool) -> ops.TRowsGenerator:
+        table: dict[bytes, list[ops.TRow]] = {}
+        for key, row in build:
+            table.setdefault(key, []).append(row)
+
+        matched = set()
+        for key, row in probe:
+            group = table.get(key)
+            if group is None:
+                group = []
+            else:
+                matched.add(key)
+            yield from self.joiner(self.keys, group, [row]) if build_is_left else self.joiner(self.keys, [row], group)
+
+        for key, group in table.items():
+            if key not in matched:
+                yield from self.joiner(self.keys, group, []) if build_is_left else self.joiner(self.keys, [], group)
+
+    def _grace_join(
+        self, inputs: tuple[ops.TRowsIterable, ops.TRowsIterable], row_key: tp.Callable[[ops.TRow], bytes]
+    ) -> ops.TRowsGenerator:
+        directory = tempfile.mkdtemp(prefix='compgraph-join-')
+        try:
+            paths = [
+                [os.path.join(directory, f'{side}-{partition}') for partition in range(self.partitions)]
+                for side in (0, 1)
+            ]
+            counts = [
+                write_partitions(((row_key(row), row) for row in rows), side_paths)
+                for rows, side_paths in zip(inputs, paths)
+            ]
+
+            for partition in range(self.partitions):
+                build_is_left = counts[0][partition] <= counts[1][partition]
+                left, right = read_partition(paths[0][partition]), read_partition(paths[1][partition])
+                yield from self._join(*((left, right) if build_is_left else (right, left)), build_is_left)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def describe(self) -> str:
+        return f'hash join {type(self.joiner).__name__} by {ops.describe_keys(self.keys)}'
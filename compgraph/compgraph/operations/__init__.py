@@ -1,4 +1,7 @@
 from .operations_base import *  # noqa
+from .operations_columnar import *  # noqa
 from .operations_joiners import *  # noqa
+from .operations_keys import *  # noqa
 from .operations_mappers import *  # noqa
 from .operations_reducers import *  # noqa
+from .operations_spill import *  # noqa
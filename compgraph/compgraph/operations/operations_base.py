@@ -1,44 +1,157 @@
+import functools
+import heapq
 import itertools
+import types
 
 from abc import abstractmethod, ABC
+from operator import itemgetter
 import typing as tp
 
+from .operations_keys import row_key
+from .operations_spill import SpilledRows, buffer_rows
+
 TRow = dict[str, tp.Any]
 TRowsIterable = tp.Iterable[TRow]
 TRowsGenerator = tp.Generator[TRow, None, None]
+TBatch = list[TRow]
+TBatchesIterable = tp.Iterable[TBatch]
+TBatchesGenerator = tp.Generator[TBatch, None, None]
+
+BATCH_SIZE = 1024
+
+
+def describe_keys(keys: tp.Sequence[str]) -> str:
+    return '[' + ', '.join(keys) + ']'
+
+
+def keys_prefix(keys: tp.Sequence[str], changed: tp.Container[str]) -> tuple[str, ...]:
+    """Longest prefix of keys without changed columns"""
+    return tuple(itertools.takewhile(lambda key: key not in changed, keys))
+
+
+def starts_with(keys: tp.Sequence[str], prefix: tp.Sequence[str]) -> bool:
+    return tuple(keys[:len(prefix)]) == tuple(prefix)
+
+
+def batched(rows: TRowsIterable, batch_size: int = BATCH_SIZE) -> TBatchesGenerator:
+    """Split row stream into batches of batch_size rows (the last one may be shorter)"""
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
+def unbatched(batches: TBatchesIterable) -> TRowsGenerator:
+    """Flatten batch stream into row stream"""
+    for batch in batches:
+        yield from batch
 
 
 class Operation(ABC):
+    spawns_process: bool = False
+    batch_native: bool = False
+    replayable: bool = False
+
     @abstractmethod
     def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
         pass
 
+    def call_batches(self, *inputs: TBatchesIterable, **kwargs: tp.Any) -> TBatchesGenerator:
+        """Batch protocol: consume and produce lists of rows.
+        Operations with batch_native set implement it without going through single rows,
+        for the rest it adapts row-at-a-time __call__
+        :param inputs: batch streams of operation inputs
+        """
+        yield from batched(self(*map(unbatched, inputs), **kwargs))
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        """Keys the output is known to be sorted by (empty if unknown)
+        :param inputs: keys every input of operation is sorted by
+        """
+        return ()
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        """Upper bound of number of output rows (None if unknown)
+        :param inputs: upper bounds of numbers of rows of every input
+        """
+        return None
+
+    def describe(self) -> str:
+        """Short description of operation for execution plans"""
+        return type(self).__name__
+
 
 class Read(Operation):
-    def __init__(self, filename: str, parser: tp.Callable[[str], TRow]) -> None:
+    batch_native = True
+
+    def __init__(
+        self, filename: str, parser: tp.Callable[[str], TRow], sorted_by: tp.Sequence[str] = ()
+    ) -> None:
+        """
+        :param filename: filename to read from
+        :param parser: parser from string to Row
+        :param sorted_by: keys the file is known to be sorted by
+        """
         self.filename = filename
         self.parser = parser
+        self.sorted_by = tuple(sorted_by)
 
     def __call__(self, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
         with open(self.filename) as f:
             for line in f:
                 yield self.parser(line)
 
+    def call_batches(self, *inputs: TBatchesIterable, **kwargs: tp.Any) -> TBatchesGenerator:
+        parser = self.parser
+        with open(self.filename) as f:
+            while True:
+                lines = list(itertools.islice(f, BATCH_SIZE))
+                if not lines:
+                    break
+                yield [parser(line) for line in lines]
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return self.sorted_by
+
+    def describe(self) -> str:
+        return f'read file {self.filename}'
+
 
 class ReadIterFactory(Operation):
-    def __init__(self, name: str) -> None:
+    batch_native = True
+
+    def __init__(self, name: str, sorted_by: tp.Sequence[str] = ()) -> None:
+        """
+        :param name: name of kwarg to use as data source
+        :param sorted_by: keys the rows are known to be sorted by
+        """
         self.name = name
+        self.sorted_by = tuple(sorted_by)
 
     def __call__(self, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
         for row in kwargs[self.name]():
             yield row
 
+    def call_batches(self, *inputs: TBatchesIterable, **kwargs: tp.Any) -> TBatchesGenerator:
+        yield from batched(kwargs[self.name]())
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return self.sorted_by
+
+    def describe(self) -> str:
+        return f'read iterator {self.name}'
+
 
 # ##################################### Operations ######################################
 
 
 class Mapper(ABC):
     """Base class for mappers"""
+    # mapper yields at most one row for every row, so it does not grow the table
+    one_row_per_row: bool = False
+
     @abstractmethod
     def __call__(self, row: TRow) -> TRowsGenerator:
         """
@@ -46,8 +159,44 @@ class Mapper(ABC):
         """
         pass
 
+    def map_batch(self, rows: TBatch) -> TBatch:
+        """Map list of rows at once; adapts row-at-a-time __call__,
+        mappers override it to skip a generator per row
+        :param rows: table rows
+        """
+        mapped: TBatch = []
+        extend = mapped.extend
+        for row in rows:
+            extend(self(row))
+        return mapped
+
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        """Longest prefix of keys the output stays sorted by when input is sorted by keys;
+        unknown mappers are expected to break any order
+        :param keys: keys input is sorted by
+        """
+        return ()
+
+    def describe(self) -> str:
+        """Short description of mapper for execution plans"""
+        return type(self).__name__
+
+
+def chain_ordered_by(mappers: tp.Iterable[Mapper], keys: tuple[str, ...]) -> tuple[str, ...]:
+    """Keys output of mappers applied one after another is sorted by"""
+    for mapper in mappers:
+        keys = mapper.ordered_by(keys) if keys else ()
+    return keys
+
+
+def chain_max_rows(mappers: tp.Iterable[Mapper], rows: tp.Optional[int]) -> tp.Optional[int]:
+    """Upper bound of number of rows mappers applied one after another give for rows input rows"""
+    return rows if all(mapper.one_row_per_row for mapper in mappers) else None
+
 
 class Map(Operation):
+    batch_native = True
+
     def __init__(self, mapper: Mapper) -> None:
         self.mapper = mapper
 
@@ -55,9 +204,90 @@ class Map(Operation):
         for row in rows:
             yield from self.mapper(row)
 
+    def call_batches(self, *inputs: TBatchesIterable, **kwargs: tp.Any) -> TBatchesGenerator:
+        map_batch = self.mapper.map_batch
+        for batch in inputs[0]:
+            mapped = map_batch(batch)
+            if mapped:
+                yield mapped
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return self.mapper.ordered_by(inputs[0])
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        return chain_max_rows([self.mapper], inputs[0])
+
+    def describe(self) -> str:
+        return f'map {self.mapper.describe()}'
+
+
+class FusedMap(Operation):
+    """
+    Chain of adjacent maps executed as one operation.
+    Rows are taken in chunks and every mapper is applied to the whole chunk
+    inline, so a row does not travel through a generator frame per map.
+    Memory bound: mappers which may yield several rows per row get their input
+    in slices sized by the fan-out seen so far, so that every call gives about
+    chunk_size rows, and the output is passed down the chain before the next slice
+    is mapped. So every mapper holds about chunk_size rows at a time
+    instead of a chunk multiplied by fan-outs of all mappers before it
+    """
+    batch_native = True
+
+    def __init__(self, mappers: tp.Sequence[Mapper], chunk_size: int = BATCH_SIZE) -> None:
+        """
+        :param mappers: mappers in order of application
+        :param chunk_size: number of rows processed by every mapper at once
+        """
+        self.mappers = list(mappers)
+        self.chunk_size = chunk_size
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        for chunk in self.call_batches(batched(rows, self.chunk_size)):
+            yield from chunk
+
+    def call_batches(self, *inputs: TBatchesIterable, **kwargs: tp.Any) -> TBatchesGenerator:
+        # input slice sizes for mappers which may multiply rows, adapted to their fan-out
+        slice_sizes = [1] * len(self.mappers)
+        for chunk in inputs[0]:
+            yield from self._map_chunk(chunk, 0, slice_sizes)
+
+    def _map_chunk(self, chunk: TBatch, start: int, slice_sizes: list[int]) -> TBatchesGenerator:
+        """Apply mappers from start on to chunk, depth first after mappers which may multiply rows"""
+        for index in range(start, len(self.mappers)):
+            mapper = self.mappers[index]
+            if mapper.one_row_per_row:
+                chunk = mapper.map_batch(chunk)
+                continue
+
+            position = 0
+            while position < len(chunk):
+                rows = chunk[position:position + slice_sizes[index]]
+                position += len(rows)
+                mapped = mapper.map_batch(rows)
+                if mapped:
+                    slice_sizes[index] = max(1, min(self.chunk_size, len(rows) * self.chunk_size // len(mapped)))
+                    yield from self._map_chunk(mapped, index + 1, slice_sizes)
+            return
+
+        if chunk:
+            yield chunk
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return chain_ordered_by(self.mappers, inputs[0])
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        return chain_max_rows(self.mappers, inputs[0])
+
+    def describe(self) -> str:
+        return 'map ' + ' -> '.join(mapper.describe() for mapper in self.mappers) + ' (fused)'
+
 
 class Reducer(ABC):
     """Base class for reducers"""
+    # upper bound of number of rows reducer yields for a group, None if unknown
+    rows_per_group: tp.Optional[int] = None
+
     @abstractmethod
     def __call__(self, group_key: tuple[str, ...], rows: TRowsIterable) -> TRowsGenerator:
         """
@@ -66,6 +296,44 @@ class Reducer(ABC):
         pass
 
 
+class CombinableReducer(Reducer):
+    """
+    Base class for reducers folding rows of a group into a state.
+    States of parts of one group can be merged, so a group may be
+    aggregated in parts, in any order of parts and without sorting
+    """
+
+    @abstractmethod
+    def initial(self) -> tp.Any:
+        """State of empty group"""
+        pass
+
+    @abstractmethod
+    def accumulate(self, state: tp.Any, row: TRow) -> tp.Any:
+        """State of group extended with row"""
+        pass
+
+    @abstractmethod
+    def merge(self, state: tp.Any, other: tp.Any) -> tp.Any:
+        """State of group made of two parts with states state and other"""
+        pass
+
+    @abstractmethod
+    def finalize(self, key_values: TRow, state: tp.Any) -> TRowsGenerator:
+        """
+        :param key_values: values of group key columns
+        :param state: state of the whole group
+        """
+        pass
+
+    def __call__(self, group_key: tuple[str, ...], rows: TRowsIterable) -> TRowsGenerator:
+        state = self.initial()
+        row = None
+        for row in rows:
+            state = self.accumulate(state, row)
+        yield from self.finalize({} if row is None else {column: row[column] for column in group_key}, state)
+
+
 class Reduce(Operation):
     def __init__(self, reducer: Reducer, keys: tp.Sequence[str]) -> None:
         self.reducer = reducer
@@ -75,6 +343,53 @@ class Reduce(Operation):
         for _, group_items in itertools.groupby(rows, lambda row: {column: row[column] for column in self.keys}):
             yield from self.reducer(tuple(self.keys), group_items)
 
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        if self.keys and starts_with(inputs[0], self.keys):
+            return tuple(self.keys)
+        return ()
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        if not self.keys:
+            return self.reducer.rows_per_group
+        return None
+
+    def describe(self) -> str:
+        return f'reduce {type(self.reducer).__name__} by {describe_keys(self.keys)}'
+
+
+TColumnsGetter = tp.Callable[[TRow], tuple[tp.Any, ...]]
+TJoinLayout = tuple[tuple[str, ...], TColumnsGetter, TColumnsGetter]
+JOIN_LAYOUT_CACHE_SIZE = 1024
+
+
+def columns_getter(columns: tp.Sequence[str]) -> TColumnsGetter:
+    """Function returning tuple of values of columns of row"""
+    if len(columns) > 1:
+        return itemgetter(*columns)
+    if columns:
+        column, = columns
+        return lambda row: (row[column],)
+    return lambda row: ()
+
+
+@functools.lru_cache(maxsize=JOIN_LAYOUT_CACHE_SIZE)
+def join_layout(
+    keys: tuple[str, ...], columns_a: tuple[str, ...], columns_b: tuple[str, ...],
+    suffix_a: str, suffix_b: str
+) -> TJoinLayout:
+    """Layout of joined row for a pair of input schemas: keys are taken from left row,
+    other columns present in both rows get suffixes
+    :return: names of output columns and getters of their values from left and right rows
+    """
+    set_a, set_b = set(columns_a) - set(keys), set(columns_b) - set(keys)
+    only_a = [column for column in columns_a if column in set_a - set_b]
+    only_b = [column for column in columns_b if column in set_b - set_a]
+    common = [column for column in columns_a if column in set_a & set_b]
+
+    names = keys + tuple(only_a) + tuple(column + suffix_a for column in common) \
+        + tuple(only_b) + tuple(column + suffix_b for column in common)
+    return names, columns_getter(keys + tuple(only_a + common)), columns_getter(only_b + common)
+
 
 class Joiner(ABC):
     """Base class for joiners"""
@@ -92,40 +407,86 @@ class Joiner(ABC):
         pass
 
     def _inner_join(self, keys: tp.Sequence[str], rows_a: TRowsIterable, rows_b: TRowsIterable) -> TRowsGenerator:
-        rows = list(rows_b)
-
+        """Cross product of rows. Joined rows are built by layouts computed once per pair of schemas;
+        a single left row is joined to right rows as they come, right rows are read
+        into a list only when several left rows need them. Right groups outgrowing
+        the join group memory limit are spilled to disk and streamed from there
+        """
+        keys = tuple(keys)
+        rows_a = iter(rows_a)
+        first = next(rows_a, None)
+        if first is None:
+            return
+        second = next(rows_a, None)
+
+        if second is None:
+            schema_a = tuple(first)
+            single: dict[tuple[str, ...], tuple[tuple[str, ...], tuple[tp.Any, ...], TColumnsGetter]] = {}
+            for row_b in rows_b:
+                schema_b = tuple(row_b)
+                found = single.get(schema_b)
+                if found is None:
+                    names, get_a, get_b = join_layout(keys, schema_a, schema_b, self.suffix_a, self.suffix_b)
+                    found = single[schema_b] = (names, get_a(first), get_b)
+                names, values_a, get_b = found
+                yield dict(zip(names, values_a + get_b(row_b)))
+            return
+
+        rows = rows_b if isinstance(rows_b, list) else buffer_rows(rows_b)
+        if isinstance(rows, SpilledRows):
+            try:
+                yield from self._spilled_join(keys, itertools.chain([first, second], rows_a), rows)
+            finally:
+                rows.close()
+            return
+        if not rows:
+            return
+
+        schemas_b = [tuple(row_b) for row_b in rows]
+        layouts: dict[tuple[tuple[str, ...], tuple[str, ...]], TJoinLayout] = {}
+        for row_a in itertools.chain([first, second], rows_a):
+            schema_a = tuple(row_a)
+            for schema_b, row_b in zip(schemas_b, rows):
+                layout = layouts.get((schema_a, schema_b))
+                if layout is None:
+                    layout = join_layout(keys, schema_a, schema_b, self.suffix_a, self.suffix_b)
+                    layouts[schema_a, schema_b] = layout
+                names, get_a, get_b = layout
+                yield dict(zip(names, get_a(row_a) + get_b(row_b)))
+
+    def _spilled_join(self, keys: tuple[str, ...], rows_a: TRowsIterable, rows_b: TRowsIterable) -> TRowsGenerator:
+        """Cross product with right rows which are read again for every left row"""
+        layouts: dict[tuple[tuple[str, ...], tuple[str, ...]], TJoinLayout] = {}
         for row_a in rows_a:
-            for row_b in rows:
-                new_row = {key: row_a[key] for key in keys}
-
-                a_cols = set(row_a.keys()) - set(keys)
-                b_cols = set(row_b.keys()) - set(keys)
-
-                for column in (a_cols - b_cols):
-                    new_row[column] = row_a[column]
-
-                for column in (b_cols - a_cols):
-                    new_row[column] = row_b[column]
-
-                for column in (a_cols & b_cols):
-                    new_row[column + self.suffix_a] = row_a[column]
-                    new_row[column + self.suffix_b] = row_b[column]
-
-                yield new_row
+            schema_a = tuple(row_a)
+            for row_b in rows_b:
+                schema_b = tuple(row_b)
+                layout = layouts.get((schema_a, schema_b))
+                if layout is None:
+                    layout = join_layout(keys, schema_a, schema_b, self.suffix_a, self.suffix_b)
+                    layouts[schema_a, schema_b] = layout
+                names, get_a, get_b = layout
+                yield dict(zip(names, get_a(row_a) + get_b(row_b)))
 
 
 class Join(Operation):
-    def __init__(self, joiner: Joiner, keys: tp.Sequence[str]):
+    def __init__(self, joiner: Joiner, keys: tp.Sequence[str], semi_join: bool = False):
+        """
+        :param joiner: join strategy to use
+        :param keys: keys to join on
+        :param semi_join: let the planner filter input which unmatched rows are dropped
+            by keys of the other input before it is sorted
+        """
         self.keys = keys
         self.joiner = joiner
+        self.semi_join = semi_join
 
     def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
-        groups_left = iter(itertools.groupby(
-            rows, key=lambda row: tuple(row[column] for column in self.keys)
-        ))
-        groups_right = iter(itertools.groupby(
-            args[0], key=lambda row: tuple(row[column] for column in self.keys)
-        ))
+        """Merge join of inputs sorted by keys; groups are matched by encoded keys,
+        so None and values of mixed types in keys are compared consistently with sort
+        """
+        groups_left = iter(itertools.groupby(rows, key=row_key(self.keys)))
+        groups_right = iter(itertools.groupby(args[0], key=row_key(self.keys)))
 
         key_left, group_left = next(groups_left, (None, []))
         key_right, group_right = next(groups_right, (None, []))
@@ -148,18 +509,145 @@ class Join(Operation):
                 key_left, group_left = next(groups_left, (None, []))
                 key_right, group_right = next(groups_right, (None, []))
 
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        if self.keys and all(starts_with(keys, self.keys) for keys in inputs):
+            return tuple(self.keys)
+        return ()
+
+    def describe(self) -> str:
+        return f'join {type(self.joiner).__name__} by {describe_keys(self.keys)}'
+
+
+class BroadcastJoin(Operation):
+    """
+    Join with a small right input: it is read into memory once and every row
+    of left input is joined with the right rows matching it, without sorting
+    or grouping left input. Gives the same rows in the same order as Join
+    when keys are empty, and for inner and left joins of inputs sorted by keys
+    """
+
+    def __init__(self, joiner: Joiner, keys: tp.Sequence[str]) -> None:
+        """
+        :param joiner: join strategy to use
+        :param keys: keys to join on
+        """
+        self.joiner = joiner
+        self.keys = tuple(keys)
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        if not self.keys:
+            yield from self.joiner(self.keys, rows, list(args[0]))
+            return
+
+        key = row_key(self.keys)
+        table: dict[bytes, list[TRow]] = {}
+        for row in args[0]:
+            table.setdefault(key(row), []).append(row)
+
+        for row in rows:
+            yield from self.joiner(self.keys, [row], table.get(key(row), []))
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        if self.keys and starts_with(inputs[0], self.keys):
+            return self.keys
+        return ()
+
+    def describe(self) -> str:
+        return f'broadcast join {type(self.joiner).__name__} by {describe_keys(self.keys)}'
+
+
+def close_input(iterable: tp.Iterable[tp.Any]) -> None:
+    """Close generator early, so generators it reads from are closed too
+    and release their files and processes"""
+    if isinstance(iterable, types.GeneratorType):
+        iterable.close()
+
+
+class Limit(Operation):
+    """First n rows of input; input is closed as soon as they are taken"""
+    batch_native = True
+
+    def __init__(self, n: int) -> None:
+        """
+        :param n: number of rows to take
+        """
+        self.n = n
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        yield from unbatched(self.call_batches(batched(rows)))
+
+    def call_batches(self, *inputs: TBatchesIterable, **kwargs: tp.Any) -> TBatchesGenerator:
+        left = self.n
+        batches = iter(inputs[0])
+        try:
+            while left > 0:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                if len(batch) > left:
+                    batch = batch[:left]
+                left -= len(batch)
+                yield batch
+        finally:
+            close_input(batches)
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return inputs[0]
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        return self.n if inputs[0] is None else min(self.n, inputs[0])
+
+    def describe(self) -> str:
+        return f'limit {self.n}'
+
+
+class SortLimit(Operation):
+    """
+    First n rows of input sorted by keys, what sort followed by limit gives.
+    Only n rows are kept in a bounded heap, ties are resolved in order of input
+    """
+
+    def __init__(self, keys: tp.Sequence[str], n: int) -> None:
+        """
+        :param keys: sorting keys
+        :param n: number of rows to take
+        """
+        self.keys = tuple(keys)
+        self.n = n
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        if self.n > 0:
+            yield from heapq.nsmallest(self.n, rows, key=row_key(self.keys))
+        close_input(rows)
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return self.keys
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        return self.n
+
+    def describe(self) -> str:
+        return f'top {self.n} by {describe_keys(self.keys)} in bounded heap'
+
 
 # ##################################### Dummy operator ######################################
 
 
 class DummyMapper(Mapper):
     """Yield exactly the row passed"""
+    one_row_per_row = True
+
     def __call__(self, row: TRow) -> TRowsGenerator:
         yield row
 
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return keys
+
 
 class FirstReducer(Reducer):
     """Yield only first row from passed ones"""
+    rows_per_group = 1
+
     def __call__(self, group_key: tuple[str, ...], rows: TRowsIterable) -> TRowsGenerator:
         for row in rows:
             yield row
@@ -0,0 +1,146 @@
+from abc import abstractmethod
+import typing as tp
+
+from . import operations_base as opsb
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+
+TColumn = tp.Union[list[tp.Any], 'np.ndarray[tp.Any, tp.Any]']
+
+MAX_EXACT_INT = 2 ** 53
+
+
+# ##################################### Columnar batch ######################################
+
+
+class ColumnBatch:
+    """
+    Batch of rows stored by columns: column name -> list or numpy array
+    of values, all columns hold exactly 'size' values.
+    Works without numpy, then numeric columns are just never vectorized
+    """
+
+    def __init__(self, columns: dict[str, TColumn], size: int) -> None:
+        """
+        :param columns: column values in order of columns in rows
+        :param size: number of rows
+        """
+        self.columns = columns
+        self.size = size
+
+    @classmethod
+    def from_rows(cls, rows: opsb.TBatch) -> tp.Optional['ColumnBatch']:
+        """Build batch from rows sharing one schema (same columns in the same order)
+        :return: None if rows have different schemas
+        """
+        if not rows:
+            return None
+
+        names = tuple(rows[0])
+        for row in rows:
+            if tuple(row) != names:
+                return None
+
+        return cls({name: [row[name] for row in rows] for name in names}, len(rows))
+
+    def to_rows(self) -> opsb.TBatch:
+        names = list(self.columns)
+        return [dict(zip(names, values)) for values in zip(*map(self.values, names))]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def __setitem__(self, name: str, values: TColumn) -> None:
+        self.columns[name] = values
+
+    def values(self, name: str) -> list[tp.Any]:
+        """Column as list of python values"""
+        column = self.columns[name]
+        if isinstance(column, list):
+            return column
+        return tp.cast(list[tp.Any], column.tolist())
+
+    def numeric(self, name: str) -> tp.Optional['np.ndarray[tp.Any, tp.Any]']:
+        """Column as numpy array if it holds only floats or only ints which are exact in float64
+        (so vectorized arithmetic gives the same values as python one)
+        :return: None if there is no numpy or column has other types
+        """
+        column = self.columns[name]
+        if np is None:  # pragma: no cover
+            return None
+        if not isinstance(column, list):
+            return column if column.dtype.kind in 'if' else None
+
+        types = set(map(type, column))
+        if types == {float}:
+            array = np.array(column, dtype=np.float64)
+        elif types == {int} and max(map(abs, column)) < MAX_EXACT_INT:
+            array = np.array(column, dtype=np.int64)
+        else:
+            return None
+
+        self.columns[name] = array
+        return array
+
+
+# ##################################### Columnar mappers ######################################
+
+
+class ColumnarMapper(opsb.Mapper):
+    """Mapper which also has a vectorized implementation working on a whole ColumnBatch"""
+
+    @abstractmethod
+    def map_columns(self, batch: ColumnBatch) -> ColumnBatch:
+        """
+        :param batch: rows of one schema stored by columns
+        :return: mapped batch, may be the same object changed in place
+        """
+        pass
+
+    def map_batch(self, rows: opsb.TBatch) -> opsb.TBatch:
+        return ColumnarChain([self]).map_batch(rows)
+
+
+class ColumnarChain(opsb.Mapper):
+    """
+    Consecutive columnar mappers applied to a batch with one conversion
+    to columns before the first of them and one conversion back after the last.
+    The planner never converts batches to columns on its own, as it costs more than
+    mapping rows unless numpy kernels do most of the work: map with a chain of
+    numeric mappers (Product, Divide) explicitly to use them
+    """
+
+    def __init__(self, mappers: tp.Sequence[ColumnarMapper]) -> None:
+        """
+        :param mappers: mappers in order of application
+        """
+        self.mappers = tuple(mappers)
+        self.one_row_per_row = all(mapper.one_row_per_row for mapper in self.mappers)
+
+    def __call__(self, row: opsb.TRow) -> opsb.TRowsGenerator:
+        rows = [row]
+        for mapper in self.mappers:
+            rows = [mapped for row_ in rows for mapped in mapper(row_)]
+        yield from rows
+
+    def map_batch(self, rows: opsb.TBatch) -> opsb.TBatch:
+        batch = ColumnBatch.from_rows(rows)
+        if batch is None:
+            return super().map_batch(rows)
+
+        for mapper in self.mappers:
+            batch = mapper.map_columns(batch)
+        return batch.to_rows()
+
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.chain_ordered_by(self.mappers, keys)
+
+    def describe(self) -> str:
+        return 'columnar(' + ', '.join(mapper.describe() for mapper in self.mappers) + ')'
@@ -0,0 +1,357 @@
+import datetime
+import decimal
+import math
+import struct
+import typing as tp
+import uuid
+
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+
+# ##################################### Memcomparable keys ######################################
+#
+# Key values are encoded into bytes which compare (byte-wise) the same way as values do:
+# None < numbers < strings < bytes < dates < datetimes < sequences < timedeltas < times < uuids,
+# values of one kind are ordered naturally. Every encoded value is self-delimiting, so a tuple
+# of values is encoded by concatenation. Equal values (1, 1.0, True, Decimal(1)) get equal encodings.
+# Keys with values of other types are OrderedKey objects, which compare these values as they are.
+
+_NONE = b'\x01'
+_NUMBER = b'\x02'
+_STRING = b'\x03'
+_BYTES = b'\x04'
+_DATE = b'\x05'
+_DATETIME = b'\x06'
+_SEQUENCE = b'\x07'
+_TIMEDELTA = b'\x08'
+_TIME = b'\x09'
+_UUID = b'\x0a'
+_OTHER = b'\xff'
+_END = b'\x00'
+
+_DOUBLE = struct.Struct('>d')
+_UINT64 = struct.Struct('>Q')
+_INT64 = struct.Struct('>q')
+_SIGN = 1 << 63
+_MASK = (1 << 64) - 1
+_EXACT = b'\x80'
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+NUMERIC_SORT_MIN_ROWS = 256
+
+
+def _encode_double(value: float) -> bytes:
+    if value == 0.0:
+        value = 0.0
+    elif value != value:
+        value = math.nan
+    bits, = _UINT64.unpack(_DOUBLE.pack(value))
+    return _UINT64.pack(bits ^ _MASK if bits & _SIGN else bits | _SIGN)
+
+
+def _encode_float(value: float) -> bytes:
+    return _NUMBER + _encode_double(value) + _EXACT
+
+
+_MAX_DOUBLE = 1.7976931348623157e308
+_EXACT_DECIMAL = decimal.Context(prec=decimal.MAX_PREC, traps=[decimal.Inexact])
+
+
+def _encode_difference(difference: tp.Union[int, decimal.Decimal]) -> bytes:
+    """Tiebreak between numbers with the same float approximation: the exact difference to it
+    as decimal exponent and digits (inverted for negative differences)
+    """
+    if not difference:
+        return _EXACT
+    _, digits, exponent = _EXACT_DECIMAL.abs(decimal.Decimal(difference)).normalize(_EXACT_DECIMAL).as_tuple()
+    assert isinstance(exponent, int)
+    encoded = _UINT64.pack(exponent + len(digits) - 1 + _SIGN) + bytes(digit + 1 for digit in digits) + _END
+    if difference > 0:
+        return b'\x81' + encoded
+    return b'\x7f' + bytes(255 - byte for byte in encoded)
+
+
+def _encode_int(value: int) -> bytes:
+    """Encoded as the nearest float with difference to it as a tiebreak, so ints of any size
+    compare exactly both with each other and with floats
+    """
+    if -2 ** 53 <= value <= 2 ** 53:
+        return _NUMBER + _encode_double(float(value)) + _EXACT
+    try:
+        approximation = float(value)
+    except OverflowError:
+        approximation = math.copysign(_MAX_DOUBLE, value)
+    return _NUMBER + _encode_double(approximation) + _encode_difference(value - int(approximation))
+
+
+def _encode_decimal(value: decimal.Decimal) -> bytes:
+    """Encoded as the nearest float with exact difference to it, the same way as ints"""
+    if not value.is_finite():
+        return _encode_float(math.nan if value.is_nan() else float(value))
+    approximation = float(value)
+    if math.isinf(approximation):
+        approximation = math.copysign(_MAX_DOUBLE, approximation)
+    difference = _EXACT_DECIMAL.subtract(value, decimal.Decimal(approximation))
+    return _NUMBER + _encode_double(approximation) + _encode_difference(difference)
+
+
+def _escape(data: bytes) -> bytes:
+    return data.replace(b'\x00', b'\x00\xff') + b'\x00\x00'
+
+
+def _encode_string(value: str) -> bytes:
+    if value.isascii() and '\x00' not in value:
+        return _STRING + value.encode('ascii') + b'\x00\x00'
+    return _STRING + _escape(value.encode('utf-8', 'surrogatepass'))
+
+
+def _encode_bytes(value: bytes) -> bytes:
+    return _BYTES + _escape(bytes(value))
+
+
+def _encode_date(value: datetime.date) -> bytes:
+    return _DATE + _INT64.pack(value.toordinal())
+
+
+def _encode_datetime(value: datetime.datetime) -> bytes:
+    offset = value.utcoffset()
+    if offset is not None:
+        value = value.replace(tzinfo=None) - offset
+    microseconds = (value - _EPOCH) // datetime.timedelta(microseconds=1)
+    return _DATETIME + _UINT64.pack(microseconds + _SIGN)
+
+
+def _encode_sequence(value: tp.Sequence[tp.Any]) -> bytes:
+    return _SEQUENCE + b''.join(map(encode_value, value)) + _END
+
+
+def _encode_timedelta(value: datetime.timedelta) -> bytes:
+    return _TIMEDELTA + _UINT64.pack(value // datetime.timedelta(microseconds=1) + _SIGN)
+
+
+def _encode_time(value: datetime.time) -> bytes:
+    microseconds = ((value.hour * 60 + value.minute) * 60 + value.second) * 10 ** 6 + value.microsecond
+    offset = value.utcoffset()
+    if offset is not None:
+        microseconds -= offset // datetime.timedelta(microseconds=1)
+    return _TIME + _UINT64.pack(microseconds + _SIGN)
+
+
+def _encode_uuid(value: uuid.UUID) -> bytes:
+    return _UUID + value.bytes
+
+
+_ENCODERS: dict[type, tp.Callable[[tp.Any], bytes]] = {
+    type(None): lambda value: _NONE,
+    bool: _encode_int,
+    int: _encode_int,
+    float: _encode_float,
+    str: _encode_string,
+    bytes: _encode_bytes,
+    datetime.datetime: _encode_datetime,
+    datetime.date: _encode_date,
+    tuple: _encode_sequence,
+    list: _encode_sequence,
+    decimal.Decimal: _encode_decimal,
+    datetime.timedelta: _encode_timedelta,
+    datetime.time: _encode_time,
+    uuid.UUID: _encode_uuid,
+}
+
+
+def _encoder(kind: type) -> tp.Callable[[tp.Any], bytes]:
+    """Encoder for values of subclasses of supported types and of numpy scalars"""
+    for base, encoder in list(_ENCODERS.items()):
+        if issubclass(kind, base):
+            _ENCODERS[kind] = encoder
+            return encoder
+    if np is not None and issubclass(kind, np.generic):
+        _ENCODERS[kind] = lambda value: encode_value(value.item())
+        return _ENCODERS[kind]
+    raise TypeError(f'can not encode key value of type {kind.__name__}')
+
+
+def encode_value(value: tp.Any) -> bytes:
+    """Order-preserving binary encoding of one key value"""
+    encoder = _ENCODERS.get(type(value))
+    if encoder is None:
+        encoder = _encoder(type(value))
+    return encoder(value)
+
+
+def encode_key(values: tp.Iterable[tp.Any]) -> bytes:
+    """Order-preserving binary encoding of tuple of key values"""
+    return b''.join(map(encode_value, values))
+
+
+class _Other:
+    """Key value without binary encoding: greater than any byte, compared with other such values as is"""
+    __slots__ = ('value',)
+
+    def __init__(self, value: tp.Any) -> None:
+        self.value = value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Other) and bool(self.value == other.value)
+
+    def __hash__(self) -> int:
+        return hash(self.value)
+
+    def __lt__(self, other: tp.Any) -> bool:
+        return isinstance(other, _Other) and bool(self.value < other.value)
+
+    def __gt__(self, other: tp.Any) -> bool:
+        return not isinstance(other, _Other) or bool(self.value > other.value)
+
+    def __reduce__(self) -> tp.Any:
+        return _Other, (self.value,)
+
+
+def _key_items(value: tp.Any, items: list[tp.Any]) -> None:
+    """Append bytes of value encoding to items, values without encoding as _Other"""
+    if isinstance(value, (tuple, list)):
+        items.append(_SEQUENCE[0])
+        for item in value:
+            _key_items(item, items)
+        items.append(_END[0])
+        return
+    try:
+        items.extend(encode_value(value))
+    except TypeError:
+        items.append(_Other(value))
+
+
+class OrderedKey(bytes):
+    """
+    Key of values some of which have no binary encoding (user classes, numbers of other libraries...).
+    Compares with other keys as if such values were encoded by a byte greater than any other
+    followed by the value itself, so keys of values comparable with each other are ordered
+    the same way as the values. The bytes hold the encoding with all such values replaced by one byte,
+    so equal keys have equal bytes (different keys may have them too)
+    """
+
+    items: tuple[tp.Any, ...]
+
+    def __new__(cls, items: tuple[tp.Any, ...]) -> 'OrderedKey':
+        """
+        :param items: bytes of encoding as ints and values without encoding as _Other
+        """
+        key = super().__new__(cls, bytes(item if isinstance(item, int) else _OTHER[0] for item in items))
+        key.items = items
+        return key
+
+    @classmethod
+    def from_values(cls, values: tp.Iterable[tp.Any]) -> 'OrderedKey':
+        items: list[tp.Any] = []
+        for value in values:
+            _key_items(value, items)
+        return cls(tuple(items))
+
+    @staticmethod
+    def _items(other: tp.Any) -> tuple[tp.Any, ...]:
+        return other.items if isinstance(other, OrderedKey) else tuple(other)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, bytes) and self.items == self._items(other)
+
+    def __ne__(self, other: object) -> bool:
+        return not self == other
+
+    def __hash__(self) -> int:
+        return hash(self.items)
+
+    def __lt__(self, other: bytes) -> bool:
+        return self.items < self._items(other)
+
+    def __le__(self, other: bytes) -> bool:
+        return self.items <= self._items(other)
+
+    def __gt__(self, other: bytes) -> bool:
+        return self.items > self._items(other)
+
+    def __ge__(self, other: bytes) -> bool:
+        return self.items >= self._items(other)
+
+    def __reduce__(self) -> tp.Any:
+        return OrderedKey, (self.items,)
+
+
+def row_key(keys: tp.Sequence[str]) -> tp.Callable[[dict[str, tp.Any]], bytes]:
+    """Function computing encoded key of row: values of key columns in order of keys,
+    OrderedKey if some of them have no binary encoding
+    """
+    keys = tuple(keys)
+    if len(keys) == 1:
+        key, = keys
+
+        def single_key(row: dict[str, tp.Any]) -> bytes:
+            try:
+                return encode_value(row[key])
+            except TypeError:
+                return OrderedKey.from_values([row[key]])
+
+        return single_key
+
+    def composite_key(row: dict[str, tp.Any]) -> bytes:
+        try:
+            return b''.join([encode_value(row[key]) for key in keys])
+        except TypeError:
+            return OrderedKey.from_values([row[key] for key in keys])
+
+    return composite_key
+
+
+def _numeric_column(values: list[tp.Any]) -> tp.Optional['np.ndarray[tp.Any, tp.Any]']:
+    """Values as numpy array if they are all ints fitting into int64, all floats,
+    or both with ints exact in float64 (so the array orders values exactly as python does)
+    """
+    types = set(map(type, values))
+    if types == {float}:
+        return np.array(values, dtype=np.float64)
+    if types == {int}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            return None
+    if types == {int, float} and all(-2 ** 53 <= value <= 2 ** 53 for value in values if type(value) is int):
+        return np.array(values, dtype=np.float64)
+    return None
+
+
+def _numeric_sort(rows: list[dict[str, tp.Any]], keys: tp.Sequence[str]) -> tp.Optional[list[dict[str, tp.Any]]]:
+    """Stable sort by key columns holding only numbers with numpy
+    :return: None if there is no numpy or some key column is not numeric
+    """
+    if np is None or not keys or len(rows) < NUMERIC_SORT_MIN_ROWS:
+        return None
+
+    columns = []
+    for key in keys:
+        column = _numeric_column([row[key] for row in rows])
+        if column is None:
+            return None
+        columns.append(column)
+
+    order = np.argsort(columns[0], kind='stable') if len(columns) == 1 else np.lexsort(columns[::-1])
+    return [rows[index] for index in order.tolist()]
+
+
+def sort_rows(rows: tp.Iterable[dict[str, tp.Any]], keys: tp.Sequence[str]) -> list[dict[str, tp.Any]]:
+    """Stable sort of rows in order of encoded keys.
+    Numeric key columns are sorted by numpy, other rows are compared by plain values
+    while they are comparable (their order is the same), encoding is used
+    for keys with None or values of mixed types
+    """
+    rows = rows if isinstance(rows, list) else list(rows)
+    ordered = _numeric_sort(rows, keys)
+    if ordered is not None:
+        return ordered
+    try:
+        return sorted(rows, key=itemgetter(*keys))
+    except TypeError:
+        return sorted(rows, key=row_key(keys))
@@ -6,12 +6,15 @@ import re
 import typing as tp
 
 from . import operations_base as opsb
+from . import operations_columnar as opsc
 
 
 # ##################################### opsb.Mappers ######################################
 
 
 class CopyWithDelete(opsb.Mapper):
+    one_row_per_row = True
+
     def __init__(self, name: str, new_name: str):
         self.name = name
         self.new_name = new_name
@@ -21,9 +24,14 @@ class CopyWithDelete(opsb.Mapper):
 
         yield row
 
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.name, self.new_name))
+
 
 class FilterPunctuation(opsb.Mapper):
     """Left only non-punctuation symbols"""
+    one_row_per_row = True
+
     def __init__(self, column: str):
         """
         :param column: name of column to process
@@ -34,9 +42,14 @@ class FilterPunctuation(opsb.Mapper):
         row[self.column] = row[self.column].translate(str.maketrans('', '', string.punctuation))
         yield row
 
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.column,))
+
 
 class LowerCase(opsb.Mapper):
     """Replace column value with value in lower case"""
+    one_row_per_row = True
+
     def __init__(self, column: str):
         """
         :param column: name of column to process
@@ -51,6 +64,9 @@ class LowerCase(opsb.Mapper):
         row[self.column] = self._lower_case(row[self.column])
         yield row
 
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.column,))
+
 
 class Split(opsb.Mapper):
     """Split row on multiple rows by separator"""
@@ -78,9 +94,14 @@ class Split(opsb.Mapper):
 
         return (_.group(1) for _ in re.finditer(f'(?:^|{sep})((?:(?!{sep}).)*)', string_to_split))
 
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.column,))
+
 
-class Product(opsb.Mapper):
+class Product(opsc.ColumnarMapper):
     """Calculates product of multiple columns"""
+    one_row_per_row = True
+
     def __init__(self, columns: tp.Sequence[str], result_column: str = 'product') -> None:
         """
         :param columns: column names to product
@@ -96,9 +117,48 @@ class Product(opsb.Mapper):
 
         yield row
 
+    def map_batch(self, rows: opsb.TBatch) -> opsb.TBatch:
+        columns, result_column = self.columns, self.result_column
+        if result_column in columns:
+            return super().map_batch(rows)
+
+        for row in rows:
+            product = 1
+            for column in columns:
+                product *= row[column]
+            row[result_column] = product
+
+        return rows
+
+    def map_columns(self, batch: opsc.ColumnBatch) -> opsc.ColumnBatch:
+        arrays = [array for array in map(batch.numeric, self.columns) if array is not None]
+        int_bound = 1
+        for array in arrays:
+            if array.dtype.kind == 'i':
+                int_bound *= int(abs(array).max())
+
+        if arrays and len(arrays) == len(self.columns) \
+                and self.result_column not in self.columns and int_bound < 2 ** 63:
+            product = arrays[0]
+            for array in arrays[1:]:
+                product = product * array
+            batch[self.result_column] = product
+            return batch
+
+        values = [1] * len(batch)
+        for column in self.columns:
+            factors = values if column == self.result_column else batch.values(column)
+            values = [value * factor for value, factor in zip(values, factors)]
+        batch[self.result_column] = values
+        return batch
+
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.result_column,))
+
 
 class FractionLog(opsb.Mapper):
     """Calculates logarithm of fraction of 2 columns"""
+    one_row_per_row = True
 
     def __init__(self, columns: tp.Sequence[str], result_column: str = 'fraction_log') -> None:
         """
@@ -116,9 +176,21 @@ class FractionLog(opsb.Mapper):
 
         yield row
 
+    def map_batch(self, rows: opsb.TBatch) -> opsb.TBatch:
+        numerator, denominator = self.columns
+        result_column, log = self.result_column, math.log
+        for row in rows:
+            row[result_column] = log(row[numerator] / row[denominator])
+
+        return rows
+
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.result_column,))
+
 
 class Strftime(opsb.Mapper):
     """Calculates string from datetime"""
+    one_row_per_row = True
 
     def __init__(self, column: tp.Sequence[str], format: str, result_column: str = 'time_str') -> None:
         """
@@ -141,9 +213,13 @@ class Strftime(opsb.Mapper):
 
         yield row
 
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.result_column,))
+
 
 class Strptime(opsb.Mapper):
     """Calculates datetetime from string"""
+    one_row_per_row = True
 
     def __init__(self, column: tp.Sequence[str], format: str, result_column: str = 'datetime') -> None:
         """
@@ -167,9 +243,13 @@ class Strptime(opsb.Mapper):
 
         yield row
 
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.result_column,))
 
-class Divide(opsb.Mapper):
+
+class Divide(opsc.ColumnarMapper):
     """Calculates fraction of 2 columns"""
+    one_row_per_row = True
 
     def __init__(self, columns: tp.Sequence[str], result_column: str = 'fraction') -> None:
         """
@@ -187,9 +267,25 @@ class Divide(opsb.Mapper):
 
         yield row
 
+    def map_batch(self, rows: opsb.TBatch) -> opsb.TBatch:
+        numerator, denominator = self.columns
+        result_column = self.result_column
+        for row in rows:
+            row[result_column] = row[numerator] / row[denominator]
+
+        return rows
+
+    def map_columns(self, batch: opsc.ColumnBatch) -> opsc.ColumnBatch:
+        batch[self.result_column] = divide_columns(batch, *self.columns)
+        return batch
+
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.result_column,))
+
 
 class CalcHours(opsb.Mapper):
     """Calculates hours that passed in time between values of 2 columns"""
+    one_row_per_row = True
 
     def __init__(self, columns: tp.Sequence[str], result_column: str = 'hours') -> None:
         """
@@ -207,9 +303,22 @@ class CalcHours(opsb.Mapper):
 
         yield row
 
+    def map_batch(self, rows: opsb.TBatch) -> opsb.TBatch:
+        begin, finish = self.columns
+        result_column = self.result_column
+        for row in rows:
+            row[result_column] = (row[finish] - row[begin]).total_seconds() / 3600
+
+        return rows
+
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.result_column,))
+
 
 class Haversine(opsb.Mapper):
     """Calculates the great circle distance in kilometers between two points on the earth"""
+    one_row_per_row = True
+
     EARTH_RADIUS_KM = 6373
 
     def __init__(self, columns: list[str], result_column: str):
@@ -227,9 +336,14 @@ class Haversine(opsb.Mapper):
 
         yield row
 
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, (self.result_column,))
+
 
 class Filter(opsb.Mapper):
     """Remove records that don't satisfy some condition"""
+    one_row_per_row = True
+
     def __init__(self, condition: tp.Callable[[opsb.TRow], bool]) -> None:
         """
         :param condition: if condition is not true - remove record
@@ -240,9 +354,18 @@ class Filter(opsb.Mapper):
         if self.condition(row):
             yield row
 
+    def map_batch(self, rows: opsb.TBatch) -> opsb.TBatch:
+        condition = self.condition
+        return [row for row in rows if condition(row)]
+
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return keys
+
 
 class Project(opsb.Mapper):
     """Leave only mentioned columns"""
+    one_row_per_row = True
+
     def __init__(self, columns: tp.Sequence[str]) -> None:
         """
         :param columns: names of columns
@@ -251,3 +374,19 @@ class Project(opsb.Mapper):
 
     def __call__(self, row: opsb.TRow) -> opsb.TRowsGenerator:
         yield {col: row[col] for col in self.columns}
+
+    def map_batch(self, rows: opsb.TBatch) -> opsb.TBatch:
+        columns = self.columns
+        return [{col: row[col] for col in columns} for row in rows]
+
+    def ordered_by(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        return opsb.keys_prefix(keys, set(keys) - set(self.columns))
+
+
+def divide_columns(batch: opsc.ColumnBatch, numerator: str, denominator: str) -> opsc.TColumn:
+    """Elementwise fraction of two columns, vectorized when both are numeric and there is no zero division"""
+    numerators, denominators = batch.numeric(numerator), batch.numeric(denominator)
+    if numerators is not None and denominators is not None and denominators.all():
+        return numerators / denominators
+
+    return [a / b for a, b in zip(batch.values(numerator), batch.values(denominator))]
@@ -1,7 +1,7 @@
 
 import heapq
 
-from collections import defaultdict
+from abc import abstractmethod
 
 import typing as tp
 
@@ -9,6 +9,9 @@ from . import operations_base as opsb
 
 # ##################################### opsb.Reducers ######################################
 
+# counts of words in order of their first occurrence and number of rows
+TWordCounts = tuple[dict[tp.Any, int], int]
+
 
 class TopN(opsb.Reducer):
     """Calculate top N by value"""
@@ -19,13 +22,14 @@ class TopN(opsb.Reducer):
         """
         self.column_max = column
         self.n = n
+        self.rows_per_group = n
 
     def __call__(self, group_key: tuple[str, ...], rows: opsb.TRowsIterable) -> opsb.TRowsGenerator:
         for row in heapq.nlargest(self.n, rows, lambda r: r[self.column_max]):
             yield row
 
 
-class TermFrequency(opsb.Reducer):
+class TermFrequency(opsb.CombinableReducer):
     """Calculate frequency of values in column"""
     def __init__(self, words_column: str, result_column: str = 'tf') -> None:
         """
@@ -35,22 +39,47 @@ class TermFrequency(opsb.Reducer):
         self.words_column = words_column
         self.result_column = result_column
 
-    def __call__(self, group_key: tuple[str, ...], rows: opsb.TRowsIterable) -> opsb.TRowsGenerator:
-        counts: dict[str, int] = defaultdict(int)
-        values: tp.Any = dict()
-        count_rows = 0
+    def initial(self) -> TWordCounts:
+        return {}, 0
 
-        for row in rows:
-            count_rows += 1
-            counts[row[self.words_column]] += 1
+    def accumulate(self, state: TWordCounts, row: opsb.TRow) -> TWordCounts:
+        counts, count_rows = state
+        word = row[self.words_column]
+        counts[word] = counts.get(word, 0) + 1
+        return counts, count_rows + 1
 
-            values.update((col, row[col]) for col in group_key)
+    def merge(self, state: TWordCounts, other: TWordCounts) -> TWordCounts:
+        counts, count_rows = state
+        for word, count in other[0].items():
+            counts[word] = counts.get(word, 0) + count
+        return counts, count_rows + other[1]
 
+    def finalize(self, key_values: opsb.TRow, state: TWordCounts) -> opsb.TRowsGenerator:
+        counts, count_rows = state
         for word, count in counts.items():
-            yield dict(values, **{self.words_column: word, self.result_column: count / count_rows})
+            yield dict(key_values, **{self.words_column: word, self.result_column: count / count_rows})
 
 
-class Count(opsb.Reducer):
+class ColumnReducer(opsb.CombinableReducer):
+    """Base class for combinable reducers giving one value per group, put to column"""
+    rows_per_group = 1
+
+    def __init__(self, column: str) -> None:
+        """
+        :param column: name for result column
+        """
+        self.column = column
+
+    @abstractmethod
+    def result(self, state: tp.Any) -> tp.Any:
+        """Value of group with state"""
+        pass
+
+    def finalize(self, key_values: opsb.TRow, state: tp.Any) -> opsb.TRowsGenerator:
+        yield dict(key_values, **{self.column: self.result(state)})
+
+
+class Count(ColumnReducer):
     """
     Count records by key
     Example for group_key=('a',) and column='d'
@@ -59,24 +88,21 @@ class Count(opsb.Reducer):
         =>
         {'a': 1, 'd': 2}
     """
-    def __init__(self, column: str) -> None:
-        """
-        :param column: name for result column
-        """
-        self.column = column
 
-    def __call__(self, group_key: tuple[str, ...], rows: opsb.TRowsIterable) -> opsb.TRowsGenerator:
-        count_rows = 0
-        values: tp.Any = dict()
+    def initial(self) -> int:
+        return 0
+
+    def accumulate(self, state: int, row: opsb.TRow) -> int:
+        return state + 1
 
-        for row in rows:
-            values.update((col, row[col]) for col in group_key)
-            count_rows += 1
+    def merge(self, state: int, other: int) -> int:
+        return state + other
 
-        yield dict(values, **{self.column: count_rows})
+    def result(self, state: int) -> int:
+        return state
 
 
-class Sum(opsb.Reducer):
+class Sum(ColumnReducer):
     """
     Sum values aggregated by key
     Example for key=('a',) and column='b'
@@ -85,18 +111,106 @@ class Sum(opsb.Reducer):
         =>
         {'a': 1, 'b': 5}
     """
+
     def __init__(self, column: str) -> None:
         """
         :param column: name for sum column
         """
-        self.column = column
+        super().__init__(column)
+
+    def initial(self) -> tp.Any:
+        return 0
+
+    def accumulate(self, state: tp.Any, row: opsb.TRow) -> tp.Any:
+        return state + row[self.column]
+
+    def merge(self, state: tp.Any, other: tp.Any) -> tp.Any:
+        return state + other
+
+    def result(self, state: tp.Any) -> tp.Any:
+        return state
 
-    def __call__(self, group_key: tuple[str, ...], rows: opsb.TRowsIterable) -> opsb.TRowsGenerator:
-        sum = 0
-        values: tp.Any = dict()
 
-        for row in rows:
-            values.update((col, row[col]) for col in group_key)
-            sum += row[self.column]
+class Mean(ColumnReducer):
+    """Mean of column values by key, in column of the same name"""
 
-        yield dict(values, **{self.column: sum})
+    def initial(self) -> tuple[tp.Any, int]:
+        return 0, 0
+
+    def accumulate(self, state: tuple[tp.Any, int], row: opsb.TRow) -> tuple[tp.Any, int]:
+        return state[0] + row[self.column], state[1] + 1
+
+    def merge(self, state: tuple[tp.Any, int], other: tuple[tp.Any, int]) -> tuple[tp.Any, int]:
+        return state[0] + other[0], state[1] + other[1]
+
+    def result(self, state: tuple[tp.Any, int]) -> tp.Any:
+        return state[0] / state[1] if state[1] else None
+
+
+class Min(ColumnReducer):
+    """Minimum of column values by key, in column of the same name"""
+
+    def initial(self) -> tuple[tp.Any, ...]:
+        """Empty tuple for empty group, value in tuple otherwise"""
+        return ()
+
+    def accumulate(self, state: tuple[tp.Any, ...], row: opsb.TRow) -> tuple[tp.Any, ...]:
+        return self.merge(state, (row[self.column],))
+
+    def merge(self, state: tuple[tp.Any, ...], other: tuple[tp.Any, ...]) -> tuple[tp.Any, ...]:
+        return other if not state or (other and other[0] < state[0]) else state
+
+    def result(self, state: tuple[tp.Any, ...]) -> tp.Any:
+        return state[0] if state else None
+
+
+class Max(Min):
+    """Maximum of column values by key, in column of the same name"""
+
+    def merge(self, state: tuple[tp.Any, ...], other: tuple[tp.Any, ...]) -> tuple[tp.Any, ...]:
+        return other if not state or (other and state[0] < other[0]) else state
+
+
+class First(Min):
+    """Column value of the first row of group, in column of the same name"""
+
+    def merge(self, state: tuple[tp.Any, ...], other: tuple[tp.Any, ...]) -> tuple[tp.Any, ...]:
+        return state or other
+
+
+class Aggregate(opsb.CombinableReducer):
+    """
+    Several aggregates of one group computed in one pass, each put to its own column
+    Example for key=('a',), length=Sum('b'), trips=Count('trips')
+        {'a': 1, 'b': 2, 'c': 4}
+        {'a': 1, 'b': 3, 'c': 5}
+        =>
+        {'a': 1, 'length': 5, 'trips': 2}
+    """
+    rows_per_group = 1
+
+    def __init__(self, **aggregates: ColumnReducer) -> None:
+        """
+        :param aggregates: result column names with aggregates to put to them
+            (result columns of the aggregates themselves are not used)
+        """
+        self.aggregates = aggregates
+
+    def initial(self) -> list[tp.Any]:
+        return [aggregate.initial() for aggregate in self.aggregates.values()]
+
+    def accumulate(self, state: list[tp.Any], row: opsb.TRow) -> list[tp.Any]:
+        return [
+            aggregate.accumulate(part, row) for aggregate, part in zip(self.aggregates.values(), state)
+        ]
+
+    def merge(self, state: list[tp.Any], other: list[tp.Any]) -> list[tp.Any]:
+        return [
+            aggregate.merge(part, other_part)
+            for aggregate, part, other_part in zip(self.aggregates.values(), state, other)
+        ]
+
+    def finalize(self, key_values: opsb.TRow, state: list[tp.Any]) -> opsb.TRowsGenerator:
+        yield dict(key_values, **{
+            name: aggregate.result(part) for (name, aggregate), part in zip(self.aggregates.items(), state)
+        })
@@ -0,0 +1,99 @@
+import itertools
+import os
+import pickle
+import sys
+import tempfile
+import typing as tp
+
+
+# ##################################### Spilling ######################################
+#
+# Rows kept in memory up to an (estimated) size limit and written to disk above it.
+
+_TRow = dict[str, tp.Any]
+
+SIZE_SAMPLE_RATE = 64
+SPILL_CHUNK_SIZE = 1024
+JOIN_GROUP_MEMORY_LIMIT = 64 * 2 ** 20
+
+
+def row_size(row: _TRow) -> int:
+    """Rough estimate of memory taken by row"""
+    return sys.getsizeof(row) + sum(map(sys.getsizeof, row.values()))
+
+
+class SpillCounter:
+    """Number of row groups which did not fit into memory and were spilled to disk"""
+
+    def __init__(self) -> None:
+        self.groups = 0
+        self.rows = 0
+
+    def record(self, rows: int) -> None:
+        self.groups += 1
+        self.rows += rows
+
+
+join_spills = SpillCounter()
+
+
+class SpilledRows:
+    """
+    Rows written to a temporary file as pickled chunks, which can be iterated
+    any number of times reading one chunk at a time. The file is removed by close
+    """
+
+    def __init__(self, rows: tp.Iterable[_TRow]) -> None:
+        """
+        :param rows: rows to spill
+        """
+        self.count = 0
+        fd, self.path = tempfile.mkstemp(prefix='compgraph-spill-')
+        with os.fdopen(fd, 'wb') as f:
+            chunk: list[_TRow] = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= SPILL_CHUNK_SIZE:
+                    pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+                    self.count += len(chunk)
+                    chunk = []
+            pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+            self.count += len(chunk)
+
+    def __iter__(self) -> tp.Generator[_TRow, None, None]:
+        with open(self.path, 'rb') as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    break
+                yield from chunk
+
+    def close(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def buffer_rows(
+    rows: tp.Iterable[_TRow], memory_limit: tp.Optional[int] = None, counter: SpillCounter = join_spills
+) -> tp.Union[list[_TRow], SpilledRows]:
+    """Read rows to be iterated several times: into memory while they take
+    up to memory_limit bytes (estimated), otherwise all of them are spilled to disk
+    :param memory_limit: by default JOIN_GROUP_MEMORY_LIMIT
+    :param counter: counter to record spill in
+    """
+    memory_limit = JOIN_GROUP_MEMORY_LIMIT if memory_limit is None else memory_limit
+    rows = iter(rows)
+    buffer: list[_TRow] = []
+    sample_size, sample_count = 0, 0
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) % SIZE_SAMPLE_RATE == 1:
+            sample_size += row_size(row)
+            sample_count += 1
+        if len(buffer) * sample_size > memory_limit * sample_count:
+            spilled = SpilledRows(itertools.chain(buffer, rows))
+            counter.record(spilled.count)
+            return spilled
+
+    return buffer
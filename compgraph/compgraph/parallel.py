@@ -0,0 +1,214 @@
+import heapq
+import itertools
+import shutil
+import tempfile
+import typing as tp
+
+from collections import deque
+from multiprocessing import Pipe, Pool, Process, connection
+from multiprocessing.pool import AsyncResult
+from operator import itemgetter
+
+from . import operations as ops
+from .external_sort import IPC_CHUNK_SIZE, MEMORY_LIMIT, receive_chunks, sort_with_spills
+
+
+_worker_map: ops.FusedMap | None = None
+
+
+def init_worker(mappers: list[ops.Mapper]) -> None:
+    global _worker_map
+    _worker_map = ops.FusedMap(mappers)
+
+
+def map_batch(rows: ops.TBatch) -> ops.TBatch:
+    assert _worker_map is not None
+    return [row for batch in _worker_map.call_batches([rows]) for row in batch]
+
+
+class ParallelMap(ops.Operation):
+    """
+    Map which ships batches of rows to a pool of worker processes.
+    Mappers are passed to workers once at pool start, so with
+    non-fork start methods they have to be picklable.
+    Only a bounded number of batches is in flight at any moment
+    """
+    spawns_process = True
+    batch_native = True
+
+    def __init__(
+        self, mappers: tp.Sequence[ops.Mapper], workers: int,
+        batch_size: int = 1024, ordered: bool = True
+    ) -> None:
+        """
+        :param mappers: mappers in order of application
+        :param workers: number of worker processes
+        :param batch_size: number of rows sent to worker at once, batch streams are sent as they come
+        :param ordered: keep order of input rows in output
+        """
+        if workers < 1:
+            raise ValueError('number of workers has to be positive')
+
+        self.mappers = list(mappers)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.ordered = ordered
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        for batch in self.call_batches(ops.batched(rows, self.batch_size)):
+            yield from batch
+
+    def call_batches(self, *inputs: ops.TBatchesIterable, **kwargs: tp.Any) -> ops.TBatchesGenerator:
+        pending: deque[AsyncResult[ops.TBatch]] = deque()
+        with Pool(self.workers, initializer=init_worker, initargs=(self.mappers,)) as pool:
+            for batch in inputs[0]:
+                pending.append(pool.apply_async(map_batch, (batch,)))
+                if len(pending) >= 2 * self.workers:
+                    yield self._collect(pending)
+
+            while pending:
+                yield self._collect(pending)
+
+    def _collect(self, pending: deque[AsyncResult[ops.TBatch]]) -> ops.TBatch:
+        """Take mapped batch: the oldest one, or any finished one if order is not kept"""
+        if not self.ordered:
+            for result in pending:
+                if result.ready():
+                    pending.remove(result)
+                    return result.get()
+
+        return pending.popleft().get()
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return ops.chain_ordered_by(self.mappers, inputs[0]) if self.ordered else ()
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        return ops.chain_max_rows(self.mappers, inputs[0])
+
+    def describe(self) -> str:
+        names = ' -> '.join(mapper.describe() for mapper in self.mappers)
+        order = '' if self.ordered else ', unordered'
+        return f'map {names} in {self.workers} worker processes{order}'
+
+
+class ParallelReduce(ops.Reduce):
+    """
+    Reduce which is allowed to run in several processes.
+    Directly after a sort by keys starting with reduce keys the planner replaces
+    the pair with PartitionedSortReduce, elsewhere it is an ordinary Reduce
+    """
+
+    def __init__(self, reducer: ops.Reducer, keys: tp.Sequence[str], workers: int) -> None:
+        """
+        :param reducer: reducer to use
+        :param keys: keys for grouping
+        :param workers: number of processes to sort and reduce in
+        """
+        if workers < 1:
+            raise ValueError('number of workers has to be positive')
+
+        super().__init__(reducer, keys)
+        self.workers = workers
+
+
+def do_sort_reduce(
+    endpoint: connection.Connection, sort_keys: tuple[str, ...],
+    reducer: ops.Reducer, reduce_keys: tuple[str, ...], memory_limit: int, directory: str
+) -> None:
+    """Sort and reduce rows sent to endpoint, spilling runs to directory owned by the parent process"""
+    rows = sort_with_spills(ops.unbatched(receive_chunks(endpoint)), sort_keys, memory_limit, directory, False)
+    reduced = (
+        (key, row)
+        for key, group in itertools.groupby(rows, ops.row_key(reduce_keys))
+        for row in reducer(reduce_keys, group)
+    )
+    while chunk := list(itertools.islice(reduced, IPC_CHUNK_SIZE)):
+        endpoint.send(chunk)
+    endpoint.send(None)
+
+
+class PartitionedSortReduce(ops.Operation):
+    """
+    Sort followed by reduce, run in several processes.
+    Rows are hash-partitioned by reduce keys, every worker sorts and reduces
+    its own partition, outputs are merged back by group key,
+    so the result is the same as of serial sort and reduce
+    """
+    spawns_process = True
+
+    def __init__(
+        self, sort_keys: tp.Sequence[str], reducer: ops.Reducer,
+        reduce_keys: tp.Sequence[str], workers: int, memory_limit: int = MEMORY_LIMIT
+    ) -> None:
+        """
+        :param sort_keys: sorting keys, reduce keys have to be their prefix
+        :param reducer: reducer to use
+        :param reduce_keys: keys for grouping and partitioning
+        :param workers: number of worker processes
+        :param memory_limit: memory for rows being sorted, shared by workers; they spill sorted runs above it
+        """
+        if not ops.starts_with(sort_keys, reduce_keys):
+            raise ValueError('reduce keys have to be a prefix of sort keys')
+        if workers < 1:
+            raise ValueError('number of workers has to be positive')
+
+        self.sort_keys = tuple(sort_keys)
+        self.reducer = reducer
+        self.reduce_keys = tuple(reduce_keys)
+        self.workers = workers
+        self.memory_limit = memory_limit
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        endpoints = []
+        processes = []
+        directory = tempfile.mkdtemp(prefix='compgraph-sort-reduce-')
+        try:
+            for _ in range(self.workers):
+                local_endpoint, remote_endpoint = Pipe()
+                process = Process(
+                    target=do_sort_reduce,
+                    args=(
+                        remote_endpoint, self.sort_keys, self.reducer, self.reduce_keys,
+                        self.memory_limit // self.workers, directory
+                    )
+                )
+                process.start()
+                endpoints.append(local_endpoint)
+                processes.append(process)
+
+            chunks: list[list[ops.TRow]] = [[] for _ in endpoints]
+            for row in rows:
+                partition = hash(tuple(row[column] for column in self.reduce_keys)) % self.workers
+                chunks[partition].append(row)
+                if len(chunks[partition]) >= IPC_CHUNK_SIZE:
+                    endpoints[partition].send(chunks[partition])
+                    chunks[partition] = []
+            for endpoint, chunk in zip(endpoints, chunks):
+                if chunk:
+                    endpoint.send(chunk)
+                endpoint.send(None)
+
+            for _, row in heapq.merge(*map(self._receive, endpoints), key=itemgetter(0)):
+                yield row
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    @staticmethod
+    def _receive(endpoint: connection.Connection) -> tp.Generator[tuple[bytes, ops.TRow], None, None]:
+        """(group key, row) pairs sent to endpoint in chunks until None"""
+        while True:
+            chunk = endpoint.recv()
+            if chunk is None:
+                break
+            yield from chunk
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return self.reduce_keys
+
+    def describe(self) -> str:
+        return f'sort by {ops.describe_keys(self.sort_keys)} and reduce {type(self.reducer).__name__} ' \
+            f'by {ops.describe_keys(self.reduce_keys)} in {self.workers} worker processes'
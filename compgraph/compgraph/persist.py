@@ -0,0 +1,132 @@
+import os
+import pickle
+import tempfile
+import typing as tp
+import weakref
+
+from . import operations as ops
+
+
+class Persist(ops.Operation):
+    """
+    Checkpoint of a row stream on local disk.
+    Rows are written once as pickled batches behind a header with the fingerprint
+    of the upstream graph, then every consumer streams them from the file.
+    Next runs replay the file given by path instead of running upstream while the fingerprint
+    (graph definition and contents of input files) is the same.
+    Without path, and for graphs reading row iterators or using objects without stable description
+    (generators, files) which have no fingerprint, rows are persisted per run only.
+    Files are replayed only if they belong to the current user and nobody else can write them,
+    as unpickling a planted file would run arbitrary code
+    """
+    batch_native = True
+    replayable = True
+
+    def __init__(self, path: tp.Optional[str] = None, fingerprint: tp.Optional[str] = None) -> None:
+        """
+        :param path: file to persist rows to, by default a private temporary file removed after the run
+        :param fingerprint: fingerprint of upstream graph, set by the planner
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self._source: tp.Optional[ops.TBatchesIterable] = None
+
+    def bind(self, fingerprint: tp.Optional[str]) -> 'Persist':
+        """Checkpoint for one plan: with known upstream fingerprint and resolved path"""
+        if self.path is not None:
+            return Persist(self.path, fingerprint)
+
+        fd, path = tempfile.mkstemp(prefix='compgraph-persist-')
+        os.close(fd)
+        persist = Persist(path)
+        weakref.finalize(persist, Persist._cleanup, path)
+        return persist
+
+    @staticmethod
+    def _cleanup(path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+
+    @property
+    def up_to_date(self) -> bool:
+        """File holds rows of the upstream graph as it is now"""
+        if self.fingerprint is None:
+            return False
+
+        f = self._open()
+        if f is None:
+            return False
+        with f:
+            try:
+                return bool(pickle.load(f) == self.fingerprint)
+            except (EOFError, pickle.UnpicklingError):
+                return False
+
+    def _open(self) -> tp.Optional[tp.BinaryIO]:
+        """Open the file if it exists and can be trusted: it is owned by the current user
+        and is not writable by group or others (checked on the opened file, so it can not be swapped)
+        """
+        if self.path is None:
+            return None
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+
+        status = os.fstat(f.fileno())
+        if status.st_mode & 0o022 or (hasattr(os, 'getuid') and status.st_uid != os.getuid()):
+            f.close()
+            return None
+        return f
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        yield from ops.unbatched(self.call_batches(ops.batched(rows)))
+
+    def call_batches(self, *inputs: ops.TBatchesIterable, **kwargs: tp.Any) -> ops.TBatchesGenerator:
+        """Write input to the file unless it is up to date, then stream the file.
+        Every call replays the file independently, the same input stream is written at most once
+        """
+        assert self.path is not None
+        if not inputs:
+            if not self.up_to_date:
+                raise FileNotFoundError(f'persisted rows in {self.path} changed after the graph was compiled')
+        elif inputs[0] is not self._source and not self.up_to_date:
+            self._write(inputs[0])
+            self._source = inputs[0]
+
+        f = self._open()
+        if f is None:
+            raise PermissionError(f'persisted rows in {self.path} are not owned by current user or writable by others')
+        with f:
+            pickle.load(f)
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    break
+
+    def _write(self, batches: ops.TBatchesIterable) -> None:
+        assert self.path is not None
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        fd, temporary_path = tempfile.mkstemp(prefix='.compgraph-persist-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(self.fingerprint, f, pickle.HIGHEST_PROTOCOL)
+                for batch in batches:
+                    pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, self.path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return inputs[0]
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        return inputs[0]
+
+    def describe(self) -> str:
+        state = ' (up to date)' if self.up_to_date else ''
+        return f'persist to {self.path}{state}'
@@ -0,0 +1,381 @@
+import dataclasses
+import functools
+import os
+import typing as tp
+
+from collections import Counter
+
+from . import operations as ops
+from .aggregate import HashAggregate, MergeAggregate, PartialAggregate
+from .external_sort import ExternalSort
+from .fingerprint import InputHashes, graph_fingerprints, input_hashes
+from .hash_join import HashJoin
+from .parallel import ParallelMap, ParallelReduce, PartitionedSortReduce
+from .persist import Persist
+from .semi_join import SemiJoinFilter
+from .spool import Spool
+
+if tp.TYPE_CHECKING:  # pragma: no cover
+    from .graph import Graph
+
+
+# Operations which outputs are cached by incremental runs, maps are cheap to redo from them
+CACHED_OPERATIONS = (
+    ExternalSort, PartitionedSortReduce, ops.Reduce, HashAggregate, MergeAggregate,
+    ops.Join, ops.BroadcastJoin, HashJoin
+)
+# Keyed joins with right input known to have at most that many rows are broadcast
+BROADCAST_MAX_ROWS = 10000
+# Joiners giving the same rows when the right input is joined to every left row separately
+BROADCAST_JOINERS = (ops.InnerJoiner, ops.LeftJoiner)
+# Input of join (left or right) which rows without match are dropped by joiners of that type
+SEMI_JOIN_FILTERED_INPUT: dict[type[ops.Joiner], int] = {ops.InnerJoiner: 0, ops.RightJoiner: 0, ops.LeftJoiner: 1}
+
+
+@dataclasses.dataclass
+class Stage:
+    """One physical step of a plan: operation applied to outputs of other stages"""
+    operation: ops.Operation
+    inputs: list[int]
+    sorted_by: tuple[str, ...] = ()
+    max_rows: tp.Optional[int] = None
+    consumers: int = 0
+
+    @property
+    def shared(self) -> bool:
+        """Output is read by several stages and has to be spooled (or replayed)"""
+        return self.consumers > 1
+
+
+class Plan:
+    """
+    Physical plan compiled from a graph: stages in topological order,
+    every stage reads outputs of stages before it, the last stage is the result.
+    Plan is executed iteratively, stage by stage, shared stages run once per execution
+    """
+
+    def __init__(self, stages: list[Stage], skipped_sorts: int = 0) -> None:
+        self.stages = stages
+        self.skipped_sorts = skipped_sorts
+        for stage in stages:
+            for index in stage.inputs:
+                self.stages[index].consumers += 1
+
+    @classmethod
+    def from_graph(cls, graph: 'Graph', cache_dir: tp.Optional[str] = None) -> 'Plan':
+        """Compile graph into plan.
+        Every stage tracks keys its output is sorted by and how many rows
+        it may give; sorts which are already satisfied by their input are dropped,
+        as are stages only feeding checkpoints which are up to date.
+        Joins without keys or with small right input become broadcast joins,
+        semi-joins get their input filtered by keys of the other input before sort,
+        combinable reduces after sort get partial aggregation before it
+        :param graph: graph which result is the plan result
+        :param cache_dir: directory to cache outputs of sorts, reduces and joins in,
+            keyed by fingerprints of their definitions and input files contents
+        """
+        consumers = cls._count_consumers(graph)
+
+        hashes = input_hashes
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            hashes = InputHashes(os.path.join(cache_dir, 'inputs.json'))
+        fingerprints: dict[Graph, tp.Optional[str]] = {}
+
+        def fingerprint(node: 'Graph') -> tp.Optional[str]:
+            if not fingerprints:
+                fingerprints.update(graph_fingerprints(graph, hashes))
+            return fingerprints[node]
+
+        skipped_sorts = 0
+        stages: list[Stage] = []
+        indices: dict[Graph, int] = {}
+        stack: list[tuple[Graph, bool]] = [(graph, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in indices:
+                continue
+
+            operation, children = cls._physical_operation(node, consumers)
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children) if child not in indices)
+                continue
+
+            inputs = [indices[child] for child in children]
+            if isinstance(operation, ExternalSort) and ops.starts_with(stages[inputs[0]].sorted_by, operation.keys):
+                indices[node] = inputs[0]
+                skipped_sorts += 1
+                continue
+            if isinstance(operation, ops.SortLimit) and ops.starts_with(stages[inputs[0]].sorted_by, operation.keys):
+                operation = ops.Limit(operation.n)
+                skipped_sorts += 1
+            if isinstance(operation, ops.Join):
+                join = operation
+                operation, inputs = cls._broadcast(join, inputs, stages, consumers[children[1]])
+                if join.semi_join and type(join.joiner) in SEMI_JOIN_FILTERED_INPUT:
+                    side = SEMI_JOIN_FILTERED_INPUT[type(join.joiner)]
+                    inputs[side] = cls._semi_join(join.keys, inputs, side, stages, consumers[children[side]])
+            if isinstance(operation, ops.Reduce) and isinstance(operation.reducer, ops.CombinableReducer):
+                operation, inputs = cls._combine(operation, inputs, stages, consumers[children[0]])
+
+            if isinstance(operation, Persist):
+                operation = operation.bind(fingerprint(children[0]))
+
+            indices[node] = len(stages)
+            stages.append(Stage(
+                operation, inputs,
+                operation.ordered_by([stages[i].sorted_by for i in inputs]),
+                operation.max_rows([stages[i].max_rows for i in inputs])
+            ))
+
+            if cache_dir is not None and isinstance(operation, CACHED_OPERATIONS) and fingerprint(node) is not None:
+                cache = Persist(os.path.join(cache_dir, f'{fingerprint(node)}.pickle'), fingerprint(node))
+                indices[node] = len(stages)
+                stages.append(Stage(cache, [len(stages) - 1], stages[-1].sorted_by, stages[-1].max_rows))
+
+        for stage in stages:
+            if isinstance(stage.operation, Persist) and stage.operation.up_to_date:
+                stage.inputs = []
+
+        return cls(cls._reachable(stages), skipped_sorts)
+
+    @staticmethod
+    def _broadcast(
+        join: ops.Join, inputs: list[int], stages: list[Stage], right_consumers: int
+    ) -> tuple[ops.Operation, list[int]]:
+        """Broadcast join instead of merge join where it gives the same rows
+        and right input is known to fit in memory. Otherwise the merge join is kept,
+        as it spills large groups of rows to disk.
+        Right input of keyed broadcast join needs no sort, so a sort feeding
+        only this join is bypassed (and dropped from the plan if nothing else reads it)
+        :param right_consumers: number of graph nodes reading right input of the join
+        :return: join operation and its inputs
+        """
+        right = stages[inputs[1]]
+        if right.max_rows is None or right.max_rows > BROADCAST_MAX_ROWS:
+            return join, inputs
+        if not join.keys:
+            return ops.BroadcastJoin(join.joiner, join.keys), inputs
+        if not isinstance(join.joiner, BROADCAST_JOINERS):
+            return join, inputs
+
+        if isinstance(right.operation, ExternalSort) and right_consumers == 1:
+            inputs = [inputs[0], right.inputs[0]]
+        return ops.BroadcastJoin(join.joiner, join.keys), inputs
+
+    @staticmethod
+    def _semi_join(
+        keys: tp.Sequence[str], inputs: list[int], side: int, stages: list[Stage], side_consumers: int
+    ) -> int:
+        """Add stages filtering join input by keys of the other one. If the input is a sort
+        read only by this join, the filter is put before a new copy of the sort
+        (the original sort is dropped from the plan as nothing reads it)
+        :param side: index of join input to filter
+        :param side_consumers: number of graph nodes reading the input to filter
+        :return: stage to read filtered input from
+        """
+        filtered = stages[inputs[side]]
+        sort = filtered if isinstance(filtered.operation, ExternalSort) and side_consumers == 1 else None
+        source = filtered.inputs[0] if sort is not None else inputs[side]
+
+        semi_join = SemiJoinFilter(keys)
+        stages.append(Stage(semi_join, [source, inputs[1 - side]], stages[source].sorted_by, stages[source].max_rows))
+        if sort is not None:
+            stages.append(Stage(sort.operation, [len(stages) - 1], sort.sorted_by, sort.max_rows))
+        return len(stages) - 1
+
+    @staticmethod
+    def _combine(
+        reduce: ops.Reduce, inputs: list[int], stages: list[Stage], sort_consumers: int
+    ) -> tuple[ops.Operation, list[int]]:
+        """Partial aggregation before sort by reduce keys read only by this reduce,
+        so the sort gets a row per group of every chunk instead of every row
+        (the original sort is dropped from the plan as nothing reads it)
+        :param sort_consumers: number of graph nodes reading input of the reduce
+        :return: reduce operation and its inputs
+        """
+        sort = stages[inputs[0]]
+        if not reduce.keys or not isinstance(sort.operation, ExternalSort) or sort_consumers != 1 \
+                or tuple(sort.operation.keys) != tuple(reduce.keys):
+            return reduce, inputs
+
+        assert isinstance(reduce.reducer, ops.CombinableReducer)
+        source = stages[sort.inputs[0]]
+        stages.append(Stage(PartialAggregate(reduce.reducer, reduce.keys), [sort.inputs[0]], (), source.max_rows))
+        stages.append(Stage(sort.operation, [len(stages) - 1], sort.sorted_by, source.max_rows))
+        return MergeAggregate(reduce.reducer, reduce.keys), [len(stages) - 1]
+
+    @staticmethod
+    def _reachable(stages: list[Stage]) -> list[Stage]:
+        """Stages the last stage reads from, directly or not, renumbered keeping the order"""
+        reachable = {len(stages) - 1}
+        for index in reversed(range(len(stages))):
+            if index in reachable:
+                reachable.update(stages[index].inputs)
+
+        numbers = {index: number for number, index in enumerate(sorted(reachable))}
+        return [
+            dataclasses.replace(stages[index], inputs=[numbers[i] for i in stages[index].inputs])
+            for index in sorted(reachable)
+        ]
+
+    @staticmethod
+    def _count_consumers(graph: 'Graph') -> Counter['Graph']:
+        consumers: Counter[Graph] = Counter()
+        stack = [graph]
+        while stack:
+            node = stack.pop()
+            for child in (node.main_graph, node.another_graph):
+                if child is None:
+                    continue
+                consumers[child] += 1
+                if consumers[child] == 1:
+                    stack.append(child)
+
+        return consumers
+
+    @staticmethod
+    def _physical_operation(
+        node: 'Graph', consumers: Counter['Graph']
+    ) -> tuple[ops.Operation, list['Graph']]:
+        """Operation to run for node and nodes it reads from.
+        Adjacent maps are fused into one operation, adjacent parallel maps
+        with the same settings are run by one worker pool; nodes with
+        several consumers stay out of the chain to keep their output shared.
+        Parallel reduce right after a matching sort becomes one partitioned stage,
+        limit right after a sort becomes a bounded heap
+        """
+        operation = node.operation
+        assert operation is not None
+        if isinstance(operation, ops.Map):
+            mappers, source = Plan._map_chain(node, consumers, lambda graph: isinstance(graph.operation, ops.Map))
+            if len(mappers) == 1:
+                return operation, [source]
+            return ops.FusedMap(mappers), [source]
+
+        if isinstance(operation, ParallelMap):
+            mappers, source = Plan._map_chain(node, consumers, lambda graph: (
+                isinstance(graph.operation, ParallelMap)
+                and (graph.operation.workers, graph.operation.batch_size, graph.operation.ordered)
+                == (operation.workers, operation.batch_size, operation.ordered)
+            ))
+            return ParallelMap(mappers, operation.workers, operation.batch_size, operation.ordered), [source]
+
+        if isinstance(operation, ops.Limit):
+            sort = node.main_graph
+            assert sort is not None
+            if isinstance(sort.operation, ExternalSort) and consumers[sort] == 1:
+                assert sort.main_graph is not None
+                return ops.SortLimit(sort.operation.keys, operation.n), [sort.main_graph]
+
+        if isinstance(operation, ParallelReduce):
+            sort = node.main_graph
+            assert sort is not None
+            if isinstance(sort.operation, ExternalSort) and consumers[sort] == 1 \
+                    and ops.starts_with(sort.operation.keys, operation.keys):
+                assert sort.main_graph is not None
+                return PartitionedSortReduce(
+                    sort.operation.keys, operation.reducer, operation.keys, operation.workers,
+                    sort.operation.memory_limit
+                ), [sort.main_graph]
+
+        return operation, [child for child in (node.main_graph, node.another_graph) if child is not None]
+
+    @staticmethod
+    def _map_chain(
+        node: 'Graph', consumers: Counter['Graph'], fusable: tp.Callable[['Graph'], bool]
+    ) -> tuple[list[ops.Mapper], 'Graph']:
+        """Collect mappers of fusable map nodes ending with node
+        :return: mappers in order of application and graph to read chain input from
+        """
+        mappers = []
+        source = node
+        while True:
+            assert isinstance(source.operation, (ops.Map, ParallelMap)) and source.main_graph is not None
+            if isinstance(source.operation, ops.Map):
+                mappers.append(source.operation.mapper)
+            else:
+                mappers.extend(reversed(source.operation.mappers))
+            source = source.main_graph
+            if not fusable(source) or consumers[source] > 1:
+                break
+
+        mappers.reverse()
+        return mappers, source
+
+    def execute(self, **kwargs: tp.Any) -> ops.TRowsIterable:
+        """Build row stream of the plan result; data sources passed as kwargs.
+        Chains of batch-native operations pass lists of rows to each other,
+        streams are converted between rows and batches at the chain boundaries.
+        Replayable stages are called once per consumer instead of being spooled
+        """
+        outputs: list[tp.Any] = []
+        spools: dict[int, Spool] = {}
+        for index, stage in enumerate(self.stages):
+            rows: ops.TRowsIterable
+            if stage.operation.replayable:
+                inputs = [self._input_batches(i, outputs, spools) for i in stage.inputs]
+                outputs.append(functools.partial(stage.operation.call_batches, *inputs, **kwargs))
+                continue
+
+            if stage.operation.batch_native:
+                batches = stage.operation.call_batches(
+                    *(self._input_batches(i, outputs, spools) for i in stage.inputs), **kwargs
+                )
+                outputs.append(batches)
+                rows = ops.unbatched(batches)
+            else:
+                rows = stage.operation(*(self._input_rows(i, outputs, spools) for i in stage.inputs), **kwargs)
+                outputs.append(rows)
+
+            if stage.shared:
+                spools[index] = Spool(rows, stage.consumers)
+
+        return self._input_rows(len(self.stages) - 1, outputs, spools)
+
+    def _input_rows(
+        self, index: int, outputs: list[tp.Any], spools: dict[int, Spool]
+    ) -> ops.TRowsIterable:
+        if index in spools:
+            return spools[index].reader()
+        if self.stages[index].operation.replayable:
+            return ops.unbatched(outputs[index]())
+        if self.stages[index].operation.batch_native:
+            return ops.unbatched(outputs[index])
+        return tp.cast(ops.TRowsIterable, outputs[index])
+
+    def _input_batches(
+        self, index: int, outputs: list[tp.Any], spools: dict[int, Spool]
+    ) -> ops.TBatchesIterable:
+        if index in spools:
+            return ops.batched(spools[index].reader())
+        if self.stages[index].operation.replayable:
+            return tp.cast(ops.TBatchesIterable, outputs[index]())
+        if self.stages[index].operation.batch_native:
+            return tp.cast(ops.TBatchesIterable, outputs[index])
+        return ops.batched(outputs[index])
+
+    def explain(self) -> str:
+        """Human-readable description of the plan, one stage per line"""
+        lines = []
+        for index, stage in enumerate(self.stages):
+            line = f'#{index} {stage.operation.describe()}'
+            if stage.inputs:
+                line += ' <- ' + ', '.join(f'#{i}' for i in stage.inputs)
+            if stage.sorted_by:
+                line += f' (output sorted by {ops.describe_keys(stage.sorted_by)})'
+            if stage.shared:
+                fan_out = 'replayed' if stage.operation.replayable else 'spooled'
+                line += f' [shared by {stage.consumers} consumers, {fan_out}]'
+            lines.append(line)
+
+        sorts = sum(isinstance(stage.operation, (ExternalSort, PartitionedSortReduce)) for stage in self.stages)
+        processes = sum(stage.operation.spawns_process for stage in self.stages)
+        shared = sum(stage.shared for stage in self.stages)
+        lines.append(
+            f'{len(self.stages)} stages, {sorts} sorts ({self.skipped_sorts} skipped), '
+            f'{processes} process-spawning stages, {shared} shared'
+        )
+
+        return '\n'.join(lines)
@@ -0,0 +1,107 @@
+import hashlib
+import itertools
+import typing as tp
+
+from . import operations as ops
+
+
+EXACT_KEYS_LIMIT = 1 << 20
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+
+
+class BloomFilter:
+    """Set of byte strings answering membership with false positives only"""
+
+    def __init__(self, capacity: int, bits_per_key: int = BLOOM_BITS_PER_KEY, hashes: int = BLOOM_HASHES) -> None:
+        """
+        :param capacity: expected number of keys, false positive rate grows above it
+        :param bits_per_key: bits of filter per expected key
+        :param hashes: number of bits set for every key
+        """
+        self.size = max(capacity * bits_per_key, 64)
+        self.hashes = hashes
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: bytes) -> tp.Generator[int, None, None]:
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, key: bytes) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def collect_keys(
+    rows: ops.TRowsIterable, keys: tp.Sequence[str], exact_limit: int = EXACT_KEYS_LIMIT
+) -> tp.Union[set[bytes], BloomFilter]:
+    """Encoded keys of rows: exact set while there are up to exact_limit distinct keys,
+    Bloom filter sized for twice as many keys as collected so far otherwise
+    """
+    row_key = ops.row_key(keys)
+    rows = iter(rows)
+    exact: set[bytes] = set()
+    for row in rows:
+        exact.add(row_key(row))
+        if len(exact) > exact_limit:
+            break
+    else:
+        return exact
+
+    bloom = BloomFilter(2 * len(exact))
+    for key in exact:
+        bloom.add(key)
+    for row in rows:
+        bloom.add(row_key(row))
+    return bloom
+
+
+class SemiJoinFilter(ops.Operation):
+    """
+    Drop rows which can not match anything in a join: keys of the other join input
+    are collected first (exactly, or in a Bloom filter when there are too many of them),
+    then rows with other keys are filtered out. Placed by the planner upstream of sort
+    of the filtered join input, so rows which can never match are not sorted
+    """
+    batch_native = True
+
+    def __init__(self, keys: tp.Sequence[str], exact_limit: int = EXACT_KEYS_LIMIT) -> None:
+        """
+        :param keys: join keys
+        :param exact_limit: number of distinct keys to keep in exact set, Bloom filter is used above it
+        """
+        self.keys = tuple(keys)
+        self.exact_limit = exact_limit
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        yield from ops.unbatched(self.call_batches(ops.batched(rows), ops.batched(args[0])))
+
+    def call_batches(self, *inputs: ops.TBatchesIterable, **kwargs: tp.Any) -> ops.TBatchesGenerator:
+        """Rows of the first input which keys may be among keys of the second input,
+        the second input is not read if the first one is empty
+        """
+        row_key = ops.row_key(self.keys)
+        batches = iter(inputs[0])
+        first = next(batches, None)
+        if first is None:
+            return
+
+        found = collect_keys(ops.unbatched(inputs[1]), self.keys, self.exact_limit)
+        for batch in itertools.chain([first], batches):
+            filtered = [row for row in batch if row_key(row) in found]
+            if filtered:
+                yield filtered
+
+    def ordered_by(self, inputs: tp.Sequence[tuple[str, ...]]) -> tuple[str, ...]:
+        return inputs[0]
+
+    def max_rows(self, inputs: tp.Sequence[tp.Optional[int]]) -> tp.Optional[int]:
+        return inputs[0]
+
+    def describe(self) -> str:
+        return f'semi-join filter by {ops.describe_keys(self.keys)}'
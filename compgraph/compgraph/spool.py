@@ -0,0 +1,76 @@
+import os
+import pickle
+import tempfile
+import typing as tp
+import weakref
+
+from . import operations as ops
+
+
+class Spool:
+    """
+    Disk-backed fan-out of one row stream to several consumers.
+    Upstream rows are pulled lazily by whichever consumer is ahead
+    and appended to a temporary file, lagging consumers replay them
+    from the file with their own read handle. Every consumer except
+    the leading one gets its own copy of the row, so in-place mappers
+    downstream do not affect each other.
+    """
+
+    def __init__(self, rows: ops.TRowsIterable, consumers: int) -> None:
+        """
+        :param rows: shared upstream rows
+        :param consumers: number of readers which will be requested
+        """
+        self._rows = iter(rows)
+        self._exhausted = False
+        self._written = 0
+        self._flushed = 0
+        self._active = consumers
+
+        fd, self._path = tempfile.mkstemp(prefix='compgraph-spool-')
+        self._file = os.fdopen(fd, 'wb')
+        self._finalizer = weakref.finalize(self, Spool._cleanup, self._file, self._path)
+
+    @staticmethod
+    def _cleanup(file: tp.BinaryIO, path: str) -> None:
+        file.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _pull(self) -> ops.TRow | None:
+        if self._exhausted:
+            return None
+        row = next(self._rows, None)
+        if row is None:
+            self._exhausted = True
+            return None
+        pickle.dump(row, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._written += 1
+        return row
+
+    def reader(self) -> ops.TRowsGenerator:
+        """Yield all rows of the shared stream from the beginning"""
+        read = 0
+        try:
+            with open(self._path, 'rb') as f:
+                while True:
+                    if read == self._written:
+                        row = self._pull()
+                        if row is None:
+                            return
+                        # the row we have just written is ours, skip its copy in the file
+                        read += 1
+                        f.seek(self._file.tell())
+                        yield row
+                        continue
+
+                    if read >= self._flushed:
+                        self._file.flush()
+                        self._flushed = self._written
+                    yield pickle.load(f)
+                    read += 1
+        finally:
+            self._active -= 1
+            if self._active == 0:
+                self._finalizer()
@@ -1,4 +1,12 @@
+import itertools
+import os
+import pytest
+import typing as tp
+
+from functools import partial
+
 from compgraph import operations as ops
+from compgraph.external_sort import ExternalSort
 from compgraph.graph import Graph
 
 
@@ -114,3 +122,475 @@ def test_multiple_start() -> None:
     result2 = graph.map(ops.FilterPunctuation('text')).run(docs=lambda: iter(expected2))
 
     assert expected2 == list(result2)
+
+
+def test_shared_subgraph_runs_once() -> None:
+    calls = []
+
+    def docs() -> tp.Iterator[ops.TRow]:
+        calls.append(1)
+        return iter([{'doc_id': 2, 'text': 'b'}, {'doc_id': 1, 'text': 'a'}])
+
+    shared = Graph.graph_from_iter('docs').map(ops.DummyMapper())
+    renamed = shared.map(ops.CopyWithDelete('text', 'other'))
+    graph = shared.sort(['doc_id']).join(ops.InnerJoiner(), renamed.sort(['doc_id']), ['doc_id'])
+
+    expected = [
+        {'doc_id': 1, 'text': 'a', 'other': 'a'},
+        {'doc_id': 2, 'text': 'b', 'other': 'b'},
+    ]
+
+    assert expected == list(graph.run(docs=docs))
+    assert len(calls) == 1
+
+    assert expected == list(graph.run(docs=docs))
+    assert len(calls) == 2
+
+
+def test_map_chain_is_fused() -> None:
+    graph = Graph.graph_from_iter('docs') \
+        .map(ops.Split('text')) \
+        .map(ops.Filter(lambda row: row['text'] != 'b')) \
+        .map(ops.LowerCase('text')) \
+        .map(ops.Project(['text']))
+
+    docs = [{'doc_id': i, 'text': 'A b C'} for i in range(3000)]
+
+    assert [{'text': 'a'}, {'text': 'c'}] * 3000 == list(graph.run(docs=lambda: iter(docs)))
+
+    plan = graph.compile()
+    assert len(plan.stages) == 2
+    assert isinstance(plan.stages[1].operation, ops.FusedMap)
+    assert plan.stages[1].operation.describe() == 'map Split -> Filter -> LowerCase -> Project (fused)'
+
+
+def test_explain(capsys: pytest.CaptureFixture[str]) -> None:
+    words = Graph.graph_from_iter('docs').map(ops.LowerCase('text')).map(ops.Split('text'))
+    graph = words.sort(['text']) \
+        .reduce(ops.Count('count'), ['text']) \
+        .join(ops.InnerJoiner(), words.reduce(ops.Count('total'), []), [])
+
+    graph.explain()
+
+    assert capsys.readouterr().out.splitlines() == [
+        '#0 read iterator docs',
+        '#1 map LowerCase -> Split (fused) <- #0 [shared by 2 consumers, spooled]',
+        '#2 partial aggregate Count by [text] <- #1',
+        '#3 sort by [text] in sorter process <- #2 (output sorted by [text])',
+        '#4 merge aggregate Count by [text] <- #3 (output sorted by [text])',
+        '#5 reduce Count by [] <- #1',
+        '#6 broadcast join InnerJoiner by [] <- #4, #5',
+        '7 stages, 1 sorts (0 skipped), 1 process-spawning stages, 1 shared',
+    ]
+
+
+def test_parallel_map() -> None:
+    graph = Graph.graph_from_iter('docs') \
+        .map(ops.LowerCase('text'), workers=2) \
+        .map(ops.Split('text'), workers=2)
+
+    docs = [{'doc_id': i, 'text': f'A{i} B{i}'} for i in range(5000)]
+    expected = [{'doc_id': i, 'text': text} for i in range(5000) for text in (f'a{i}', f'b{i}')]
+
+    assert expected == list(graph.run(docs=lambda: iter(docs)))
+
+    plan = graph.compile()
+    assert len(plan.stages) == 2
+    assert plan.stages[1].operation.describe() == 'map LowerCase -> Split in 2 worker processes'
+
+
+def test_parallel_map_unordered() -> None:
+    graph = Graph.graph_from_iter('docs').map(ops.Filter(lambda row: row['doc_id'] % 2 == 0), workers=3, ordered=False)
+
+    docs = [{'doc_id': i} for i in range(10000)]
+
+    result = list(graph.run(docs=lambda: iter(docs)))
+    assert sorted(result, key=lambda row: row['doc_id']) == docs[::2]
+
+
+@pytest.mark.parametrize('workers', [0, -1])
+def test_invalid_workers(workers: int) -> None:
+    graph = Graph.graph_from_iter('docs')
+
+    with pytest.raises(ValueError):
+        graph.map(ops.DummyMapper(), workers=workers)
+    with pytest.raises(ValueError):
+        graph.reduce(ops.Count('count'), ['doc_id'], workers=workers)
+    with pytest.raises(ValueError):
+        graph.sort(['doc_id'], workers=workers)
+
+
+def test_partitioned_sort_reduce() -> None:
+    words = Graph.graph_from_iter('docs').map(ops.Split('text'))
+    serial = words.sort(['text']).reduce(ops.Count('count'), ['text'])
+    parallel = words.sort(['text']).reduce(ops.Count('count'), ['text'], workers=3)
+
+    docs = [{'doc_id': i, 'text': ' '.join(f'w{j}' for j in range(i % 50))} for i in range(500)]
+
+    assert list(serial.run(docs=lambda: iter(docs))) == list(parallel.run(docs=lambda: iter(docs)))
+
+    plan = parallel.compile()
+    assert len(plan.stages) == 3
+    assert plan.stages[2].operation.describe() == \
+        'sort by [text] and reduce Count by [text] in 3 worker processes'
+
+
+def test_satisfied_sorts_are_skipped() -> None:
+    source = Graph.graph_from_iter('docs', sorted_by=['doc_id'])
+    words = source.map(ops.Split('text')).sort(['doc_id', 'text'])
+    graph = words.reduce(ops.Count('count'), ['doc_id', 'text']) \
+        .map(ops.Filter(lambda row: row['count'] > 1)) \
+        .sort(['doc_id']) \
+        .join(ops.InnerJoiner(), source.sort(['doc_id']), ['doc_id'])
+
+    plan = graph.compile()
+    assert plan.skipped_sorts == 2
+    assert [stage.sorted_by for stage in plan.stages] == [
+        ('doc_id',), ('doc_id',), (), ('doc_id', 'text'), ('doc_id', 'text'), ('doc_id', 'text'), ('doc_id',)
+    ]
+    assert plan.stages[0].shared
+
+    docs = [
+        {'doc_id': 1, 'text': 'b a b'},
+        {'doc_id': 2, 'text': 'c c'},
+        {'doc_id': 3, 'text': 'd'},
+    ]
+
+    expected = [
+        {'doc_id': 1, 'text_1': 'b', 'count': 2, 'text_2': 'b a b'},
+        {'doc_id': 2, 'text_1': 'c', 'count': 2, 'text_2': 'c c'},
+    ]
+
+    assert expected == list(graph.run(docs=lambda: iter(docs)))
+
+
+def parse_line(line: str) -> ops.TRow:
+    return {'text': line.strip()}
+
+
+@pytest.fixture
+def parsed_lines(monkeypatch: tp.Any) -> list[ops.TRow]:
+    """Rows read from files by Read operations during the test"""
+    rows: list[ops.TRow] = []
+    read_call, read_batches = ops.Read.__call__, ops.Read.call_batches
+
+    def call(self: ops.Read, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        for row in read_call(self, *args, **kwargs):
+            rows.append(row)
+            yield row
+
+    def call_batches(self: ops.Read, *inputs: ops.TBatchesIterable, **kwargs: tp.Any) -> ops.TBatchesGenerator:
+        for batch in read_batches(self, *inputs, **kwargs):
+            rows.extend(batch)
+            yield batch
+
+    monkeypatch.setattr(ops.Read, '__call__', call)
+    monkeypatch.setattr(ops.Read, 'call_batches', call_batches)
+    return rows
+
+
+def test_persist_replays_until_inputs_change(tmp_path: tp.Any, parsed_lines: list[ops.TRow]) -> None:
+    source = tmp_path / 'docs.txt'
+    source.write_text('a b\nb\n')
+
+    persisted = Graph.graph_from_file(str(source), parse_line).map(ops.Split('text')).persist(str(tmp_path / 'words'))
+    graph = persisted.sort(['text']).reduce(ops.Count('count'), ['text'])
+
+    assert [{'text': 'a', 'count': 1}, {'text': 'b', 'count': 2}] == list(graph.run())
+    assert len(parsed_lines) == 2
+
+    plan = graph.compile()
+    assert len(plan.stages) == 4
+    assert plan.stages[0].operation.describe() == f'persist to {tmp_path / "words"} (up to date)'
+    assert [{'text': 'a', 'count': 1}, {'text': 'b', 'count': 2}] == list(graph.run())
+    assert len(parsed_lines) == 2
+
+    source.write_text('c\n')
+    assert [{'text': 'c', 'count': 1}] == list(graph.run())
+    assert len(parsed_lines) == 3
+
+
+class LengthFilter:
+    def __init__(self, min_length: int) -> None:
+        self.min_length = min_length
+
+    def accepts(self, row: ops.TRow) -> bool:
+        return len(row['text']) >= self.min_length
+
+
+def longer_than(row: ops.TRow, length: int) -> bool:
+    return len(row['text']) > length
+
+
+def test_persist_recomputes_when_arguments_change(tmp_path: tp.Any, parsed_lines: list[ops.TRow]) -> None:
+    source = tmp_path / 'docs.txt'
+    source.write_text('a bb ccc\n')
+
+    def words(condition: tp.Callable[[ops.TRow], bool]) -> list[str]:
+        graph = Graph.graph_from_file(str(source), parse_line) \
+            .map(ops.Split('text')) \
+            .map(ops.Filter(condition)) \
+            .persist(str(tmp_path / 'words'))
+        return [row['text'] for row in graph.sort(['text']).run()]
+
+    assert ['bb', 'ccc'] == words(partial(longer_than, length=1))
+    assert ['bb', 'ccc'] == words(partial(longer_than, length=1))
+    assert len(parsed_lines) == 1
+    assert ['ccc'] == words(partial(longer_than, length=2))
+    assert len(parsed_lines) == 2
+
+    length_filter = LengthFilter(1)
+    assert ['a', 'bb', 'ccc'] == words(length_filter.accepts)
+    assert ['a', 'bb', 'ccc'] == words(length_filter.accepts)
+    assert len(parsed_lines) == 3
+    length_filter.min_length = 3
+    assert ['ccc'] == words(length_filter.accepts)
+    assert len(parsed_lines) == 4
+
+
+def test_persist_replays_only_trusted_files(tmp_path: tp.Any, parsed_lines: list[ops.TRow]) -> None:
+    source = tmp_path / 'docs.txt'
+    source.write_text('a b\n')
+    path = tmp_path / 'words'
+    words = Graph.graph_from_file(str(source), parse_line).map(ops.Split('text'))
+
+    assert len(list(words.persist().run())) == 2
+    assert len(list(words.persist().run())) == 2
+    assert len(parsed_lines) == 2
+
+    assert len(list(words.persist(str(path)).run())) == 2
+    assert len(list(words.persist(str(path)).run())) == 2
+    assert len(parsed_lines) == 3
+
+    path.chmod(0o666)
+    assert len(list(words.persist(str(path)).run())) == 2
+    assert len(parsed_lines) == 4
+    assert path.stat().st_mode & 0o777 == 0o600
+
+
+def test_persist_iter_source() -> None:
+    calls = []
+
+    def docs() -> tp.Iterator[ops.TRow]:
+        calls.append(1)
+        return iter([{'doc_id': 2, 'text': 'b'}, {'doc_id': 1, 'text': 'a'}])
+
+    persisted = Graph.graph_from_iter('docs').persist()
+    graph = persisted.sort(['doc_id']).join(ops.InnerJoiner(), persisted.map(ops.Project(['doc_id'])), [])
+
+    plan = graph.compile()
+    assert plan.stages[1].shared
+    assert 'replayed' in plan.explain()
+
+    assert len(list(graph.run(docs=docs))) == 4
+    assert len(calls) == 1
+
+    assert len(list(graph.run(docs=docs))) == 4
+    assert len(calls) == 2
+
+
+def test_incremental_run(tmp_path: tp.Any, parsed_lines: list[ops.TRow]) -> None:
+    source = tmp_path / 'docs.txt'
+    source.write_text('a b\nb\n')
+    cache_dir = str(tmp_path / 'cache')
+
+    graph = Graph.graph_from_file(str(source), parse_line) \
+        .map(ops.Split('text')) \
+        .sort(['text']) \
+        .reduce(ops.Count('count'), ['text'])
+
+    expected = [{'text': 'a', 'count': 1}, {'text': 'b', 'count': 2}]
+    assert expected == list(graph.compile(cache_dir).execute())
+    assert len(parsed_lines) == 2
+    assert len(graph.compile(cache_dir).stages) == 1
+
+    os.utime(source, ns=(0, 0))
+    assert expected == list(graph.compile(cache_dir).execute())
+    assert len(parsed_lines) == 2
+
+    changed = graph.map(ops.Filter(lambda row: row['count'] > 1)).sort(['count'])
+    assert [{'text': 'b', 'count': 2}] == list(changed.compile(cache_dir).execute())
+    assert len(parsed_lines) == 2
+
+    source.write_text('c\n')
+    assert [{'text': 'c', 'count': 1}] == list(graph.compile(cache_dir).execute())
+    assert len(parsed_lines) == 3
+
+
+def count_above(row: ops.TRow, threshold: int) -> bool:
+    return row['count'] > threshold
+
+
+def test_incremental_run_arguments_change(tmp_path: tp.Any, parsed_lines: list[ops.TRow]) -> None:
+    source = tmp_path / 'docs.txt'
+    source.write_text('a b\nb\n')
+    cache_dir = str(tmp_path / 'cache')
+
+    def filtered(predicate: tp.Callable[[ops.TRow], bool]) -> Graph:
+        return Graph.graph_from_file(str(source), parse_line) \
+            .map(ops.Split('text')) \
+            .sort(['text']) \
+            .reduce(ops.Count('count'), ['text']) \
+            .map(ops.Filter(predicate))
+
+    assert [{'text': 'b', 'count': 2}] == list(filtered(partial(count_above, threshold=1)).compile(cache_dir).execute())
+    assert [{'text': 'b', 'count': 2}] == list(filtered(partial(count_above, threshold=1)).compile(cache_dir).execute())
+    assert len(parsed_lines) == 2
+
+    expected = [{'text': 'a', 'count': 1}, {'text': 'b', 'count': 2}]
+    assert expected == list(filtered(partial(count_above, threshold=0)).compile(cache_dir).execute())
+    assert len(parsed_lines) == 2
+
+    rows = (i for i in range(10))
+    graph = filtered(lambda row: next(rows) >= 0)
+    assert expected == list(graph.compile(cache_dir).execute())
+    assert len(graph.compile(cache_dir).stages) > 1
+
+
+def test_source_named_cache_dir() -> None:
+    graph = Graph.graph_from_iter('cache_dir')
+    assert [{'a': 1}] == list(graph.run(cache_dir=lambda: iter([{'a': 1}])))
+
+
+def test_limit_stops_reading_input() -> None:
+    closed = []
+
+    def docs() -> tp.Iterator[ops.TRow]:
+        try:
+            for i in itertools.count():
+                yield {'doc_id': i, 'text': f'w{i}'}
+        finally:
+            closed.append(1)
+
+    graph = Graph.graph_from_iter('docs').map(ops.Split('text')).limit(3)
+
+    assert list(graph.run(docs=docs)) == [{'doc_id': i, 'text': f'w{i}'} for i in range(3)]
+    assert closed == [1]
+
+
+def test_sort_limit_is_bounded_heap() -> None:
+    docs = [{'doc_id': i, 'count': i * 7919 % 13} for i in range(1000)]
+    graph = Graph.graph_from_iter('docs').sort(['count']).limit(5)
+
+    plan = graph.compile()
+    assert [stage.operation.describe() for stage in plan.stages] == [
+        'read iterator docs', 'top 5 by [count] in bounded heap'
+    ]
+    assert list(graph.run(docs=lambda: iter(docs))) == sorted(docs, key=lambda row: row['count'])[:5]
+
+    presorted = Graph.graph_from_iter('docs', sorted_by=['count']).sort(['count']).limit(5)
+    assert presorted.compile().stages[1].operation.describe() == 'limit 5'
+
+
+def test_hash_join() -> None:
+    times = Graph.graph_from_iter('times')
+    lengths = Graph.graph_from_iter('lengths')
+    graph = times.hash_join(ops.InnerJoiner(), lengths, ['edge_id'])
+
+    result = graph.run(
+        times=lambda: iter([{'edge_id': 3, 'time': 1}, {'edge_id': 1, 'time': 2}, {'edge_id': 3, 'time': 3}]),
+        lengths=lambda: iter([{'edge_id': 1, 'length': 10}, {'edge_id': 3, 'length': 30}]),
+    )
+
+    assert list(result) == [
+        {'edge_id': 3, 'time': 1, 'length': 30},
+        {'edge_id': 1, 'time': 2, 'length': 10},
+        {'edge_id': 3, 'time': 3, 'length': 30},
+    ]
+    assert graph.compile().stages[2].operation.describe() == 'hash join InnerJoiner by [edge_id]'
+
+
+def test_broadcast_join() -> None:
+    times = Graph.graph_from_iter('times', sorted_by=['edge_id'])
+    lengths = Graph.graph_from_iter('lengths').reduce(ops.TopN('length', 2), [])
+    graph = times.join(ops.InnerJoiner(), lengths.sort(['edge_id']), ['edge_id'])
+
+    result = graph.run(
+        times=lambda: iter([{'edge_id': 1, 'time': 2}, {'edge_id': 3, 'time': 1}, {'edge_id': 3, 'time': 3}]),
+        lengths=lambda: iter([{'edge_id': 3, 'length': 30}, {'edge_id': 1, 'length': 10}, {'edge_id': 2, 'length': 5}]),
+    )
+
+    assert list(result) == [
+        {'edge_id': 1, 'time': 2, 'length': 10},
+        {'edge_id': 3, 'time': 1, 'length': 30},
+        {'edge_id': 3, 'time': 3, 'length': 30},
+    ]
+
+    plan = graph.compile()
+    assert [stage.operation.describe() for stage in plan.stages][-1] == 'broadcast join InnerJoiner by [edge_id]'
+    assert not any(isinstance(stage.operation, ExternalSort) for stage in plan.stages)
+
+    unbounded = times.join(ops.InnerJoiner(), Graph.graph_from_iter('lengths').sort(['edge_id']), ['edge_id'])
+    assert unbounded.compile().stages[-1].operation.describe() == 'join InnerJoiner by [edge_id]'
+
+
+def test_unbounded_keyless_join_spills(monkeypatch: pytest.MonkeyPatch) -> None:
+    left = Graph.graph_from_iter('left')
+    graph = left.join(ops.InnerJoiner(), Graph.graph_from_iter('right'), [])
+    assert graph.compile().stages[-1].operation.describe() == 'join InnerJoiner by []'
+
+    bounded = left.join(ops.InnerJoiner(), Graph.graph_from_iter('right').reduce(ops.Count('count'), []), [])
+    assert bounded.compile().stages[-1].operation.describe() == 'broadcast join InnerJoiner by []'
+
+    groups = ops.join_spills.groups
+    monkeypatch.setattr(ops.operations_spill, 'JOIN_GROUP_MEMORY_LIMIT', 10000)
+    result = graph.run(
+        left=lambda: iter([{'a': i} for i in range(3)]),
+        right=lambda: iter([{'b': i} for i in range(3000)]),
+    )
+
+    assert len(list(result)) == 9000
+    assert ops.join_spills.groups == groups + 1
+
+
+def test_semi_join() -> None:
+    times = Graph.graph_from_iter('times')
+    lengths = Graph.graph_from_iter('lengths').sort(['edge_id'])
+    graph = times.sort(['edge_id']).join(ops.InnerJoiner(), lengths, ['edge_id'], semi_join=True)
+
+    result = graph.run(
+        times=lambda: iter([{'edge_id': i % 10, 'time': i} for i in range(20)]),
+        lengths=lambda: iter([{'edge_id': 3, 'length': 30}, {'edge_id': 1, 'length': 10}]),
+    )
+
+    assert list(result) == [
+        {'edge_id': 1, 'time': 1, 'length': 10},
+        {'edge_id': 1, 'time': 11, 'length': 10},
+        {'edge_id': 3, 'time': 3, 'length': 30},
+        {'edge_id': 3, 'time': 13, 'length': 30},
+    ]
+
+    descriptions = [stage.operation.describe() for stage in graph.compile().stages]
+    assert descriptions.index('semi-join filter by [edge_id]') < len(descriptions) - 2
+    assert descriptions[-2] == 'sort by [edge_id] in sorter process'
+
+
+def test_aggregate() -> None:
+    graph = Graph.graph_from_iter('words').aggregate(ops.Count('count'), ['word'])
+
+    result = graph.run(words=lambda: iter([{'word': word} for word in 'b a c b a b'.split()]))
+
+    assert list(result) == [{'word': 'a', 'count': 2}, {'word': 'b', 'count': 3}, {'word': 'c', 'count': 1}]
+    assert graph.compile().stages[-1].operation.describe() == 'hash aggregate Count by [word]'
+    assert graph.compile().stages[-1].sorted_by == ('word',)
+
+
+def test_combine_before_sort() -> None:
+    graph = Graph.graph_from_iter('docs') \
+        .map(ops.Split('text')) \
+        .sort(['doc_id']) \
+        .reduce(ops.TermFrequency('text'), ['doc_id'])
+
+    docs = [{'doc_id': 2, 'text': 'b a b'}, {'doc_id': 1, 'text': 'c'}, {'doc_id': 2, 'text': 'c'}]
+    assert list(graph.run(docs=lambda: iter(docs))) == [
+        {'doc_id': 1, 'text': 'c', 'tf': 1.0},
+        {'doc_id': 2, 'text': 'b', 'tf': 0.5},
+        {'doc_id': 2, 'text': 'a', 'tf': 0.25},
+        {'doc_id': 2, 'text': 'c', 'tf': 0.25},
+    ]
+
+    assert [stage.operation.describe() for stage in graph.compile().stages][2:] == [
+        'partial aggregate TermFrequency by [doc_id]',
+        'sort by [doc_id] in sorter process',
+        'merge aggregate TermFrequency by [doc_id]',
+    ]
@@ -1,12 +1,24 @@
 import copy
+import itertools
 import dataclasses
+import math
 import pytest
+import tempfile
 import typing as tp
+import uuid
 
-from datetime import datetime
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from fractions import Fraction
 from pytest import approx
 
 from compgraph import operations as ops
+from compgraph.aggregate import COMBINE_MAX_GROUPS, HashAggregate, MAX_GROUPS, MergeAggregate, PartialAggregate
+from compgraph import external_sort
+from compgraph.external_sort import ExternalSort, IPC_CHUNK_SIZE, MEMORY_LIMIT, sorters
+from compgraph.hash_join import HashJoin
+from compgraph.parallel import PartitionedSortReduce
+from compgraph.semi_join import EXACT_KEYS_LIMIT, SemiJoinFilter
 
 
 class _Key:
@@ -162,3 +174,405 @@ def test_mapper(case: MapCase) -> None:
 
     assert isinstance(result, tp.Iterator)
     assert sorted(case.expected, key=key_func) == sorted(result, key=key_func)
+
+
+@pytest.mark.parametrize('mapper', [
+    ops.Filter(lambda row: row['x'] > 1),
+    ops.Project(['x']),
+    ops.Product(['x', 'y'], 'product'),
+    ops.Divide(['x', 'y'], 'fraction'),
+    ops.Split('text'),
+])
+def test_mapper_batch(mapper: ops.Mapper) -> None:
+    data = [
+        {'x': 1, 'y': 2, 'text': 'a b'},
+        {'x': 3, 'y': 4, 'text': 'c'},
+        {'x': 5.5, 'y': 0.5, 'text': ''},
+    ]
+
+    expected = list(ops.Map(mapper)(copy.deepcopy(data)))
+
+    assert expected == mapper.map_batch(copy.deepcopy(data))
+    assert [expected] == list(ops.Map(mapper).call_batches([copy.deepcopy(data)]))
+
+
+def test_batch_protocol_adapter() -> None:
+    data = [{'key': i // 3, 'n': i} for i in range(6000)]
+
+    batches = list(ops.Reduce(ops.FirstReducer(), ['key']).call_batches(ops.batched(iter(data))))
+
+    assert [len(batch) for batch in batches] == [ops.BATCH_SIZE, 2000 - ops.BATCH_SIZE]
+    assert list(ops.unbatched(batches)) == data[::3]
+
+
+@pytest.mark.parametrize('data', [
+    [{'x': 1, 'y': 2, 't': datetime(2020, 1, 1)}, {'x': 3, 'y': 4, 't': datetime(2020, 1, 2, 3)}],
+    [{'x': 1.5, 'y': 2.5, 't': datetime(2020, 1, 1)}, {'x': 3.25, 'y': 0.5, 't': datetime(2020, 1, 1, 0, 30)}],
+    [{'x': 2 ** 40, 'y': 2 ** 40, 't': datetime(2020, 1, 1)}, {'x': 1, 'y': 3.5, 't': datetime(2020, 1, 1)}],
+    [{'x': 2 ** 62, 'y': 2 ** 62, 't': datetime(2020, 1, 1)}, {'x': 7, 'y': 9, 't': datetime(2020, 1, 1)}],
+    [{'x': 1, 'y': 2, 't': datetime(2020, 1, 1)}, {'t': datetime(2020, 1, 1), 'y': 3, 'x': 5}],
+])
+def test_columnar_chain(data: list[ops.TRow]) -> None:
+    mappers = [
+        ops.Product(['x', 'y'], 'product'),
+        ops.Divide(['product', 'y'], 'fraction'),
+        ops.Divide(['x', 'y'], 'x'),
+    ]
+
+    expected = copy.deepcopy(data)
+    for mapper in mappers:
+        expected = list(ops.Map(mapper)(expected))
+
+    result = ops.ColumnarChain(mappers).map_batch(copy.deepcopy(data))
+
+    assert expected == result
+    assert [list(row.items()) for row in expected] == [list(row.items()) for row in result]
+    assert [type(row['product']) for row in expected] == [type(row['product']) for row in result]
+
+
+def test_columnar_zero_division() -> None:
+    with pytest.raises(ZeroDivisionError):
+        ops.ColumnarChain([ops.Divide(['x', 'y'])]).map_batch([{'x': 1.0, 'y': 0.0}])
+
+
+class Repeat(ops.Mapper):
+    def __init__(self, times: int) -> None:
+        self.times = times
+        self.batch_sizes: list[int] = []
+
+    def __call__(self, row: ops.TRow) -> ops.TRowsGenerator:
+        for i in range(self.times):
+            yield dict(row, **{f'i{self.times}': i})
+
+    def map_batch(self, rows: ops.TBatch) -> ops.TBatch:
+        self.batch_sizes.append(len(rows))
+        return super().map_batch(rows)
+
+
+def test_fused_map_bounds_fan_out() -> None:
+    first, second, last = Repeat(10), Repeat(3), Repeat(1)
+    rows = [{'n': n} for n in range(1000)]
+    fused = ops.FusedMap([first, ops.Project(['n', 'i10']), second, last], chunk_size=100)
+
+    result = list(fused(iter(rows)))
+
+    assert result == list(ops.Map(last)(ops.Map(second)(ops.Map(first)(iter(rows)))))
+    assert max(first.batch_sizes) == 10
+    assert max(second.batch_sizes) <= 100
+    assert max(last.batch_sizes) <= 100
+
+
+class DropEmpty(ops.ColumnarMapper):
+    def __init__(self, column: str) -> None:
+        self.column = column
+
+    def __call__(self, row: ops.TRow) -> ops.TRowsGenerator:
+        if row[self.column]:
+            yield row
+
+    def map_columns(self, batch: ops.ColumnBatch) -> ops.ColumnBatch:
+        keep = [bool(value) for value in batch.values(self.column)]
+        return ops.ColumnBatch(
+            {name: list(itertools.compress(batch.values(name), keep)) for name in batch.columns}, sum(keep)
+        )
+
+
+def test_columnar_chain_rows_per_row() -> None:
+    assert ops.ColumnarChain([ops.Product(['x', 'y']), ops.Divide(['x', 'y'])]).one_row_per_row
+    assert not ops.ColumnarChain([ops.Product(['x', 'y']), DropEmpty('product')]).one_row_per_row
+
+    chain = ops.ColumnarChain([ops.Product(['x', 'y']), DropEmpty('product')])
+    assert chain.map_batch([{'x': 1, 'y': 0}, {'x': 2, 'y': 3}]) == [{'x': 2, 'y': 3, 'product': 6}]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+@pytest.mark.parametrize('workers', [1, 3])
+def test_external_sort_spills_runs(compress: bool, workers: int) -> None:
+    data = [{'key': (i * 7919) % 100, 'n': i} for i in range(20000)]
+
+    result = list(ExternalSort(['key'], memory_limit=100_000, compress=compress, workers=workers)(iter(data)))
+
+    assert result == sorted(data, key=lambda row: row['key'])
+
+
+@pytest.mark.parametrize('memory_limit', [MEMORY_LIMIT, 100_000])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_sort_with_spills(tmp_path: tp.Any, monkeypatch: pytest.MonkeyPatch, memory_limit: int, workers: int) -> None:
+    monkeypatch.setattr(external_sort.os, 'cpu_count', lambda: workers)
+    data = [{'key': (i * 7919) % 100, 'n': i} for i in range(20000)]
+
+    result = external_sort.sort_with_spills(iter(data), ('key',), memory_limit, str(tmp_path), False, workers)
+
+    assert list(result) == sorted(data, key=lambda row: row['key'])
+    runs = len(list(tmp_path.iterdir()))
+    assert runs == 0 if memory_limit == MEMORY_LIMIT else runs > 0
+
+
+def test_external_sort_batches() -> None:
+    data = [{'key': i % 3, 'n': i} for i in range(10000)]
+    sort = ExternalSort(['key'])
+
+    batches = list(sort.call_batches(ops.batched(iter(data))))
+    assert [len(batch) for batch in batches] == [IPC_CHUNK_SIZE, IPC_CHUNK_SIZE, 10000 - 2 * IPC_CHUNK_SIZE]
+    assert list(ops.unbatched(batches)) == sorted(data, key=lambda row: row['key'])
+
+    rows = sort(iter(data))
+    assert next(rows) == {'key': 0, 'n': 0}
+    rows.close()
+
+
+def test_encoded_key_order() -> None:
+    values: list[tp.Any] = [
+        None, -math.inf, -2 ** 70 - 1, -2 ** 70, -2.5, -1, 0, 1, 1.5, 2 ** 53, 2 ** 53 + 1, 2.0 ** 70, 2 ** 70 + 1,
+        math.inf, '', 'a', 'a\x00', 'a\x00b', 'ab', 'b', 'é', '\U0001f600', b'', b'a',
+        datetime(1960, 1, 1), datetime(2020, 1, 1), datetime(2020, 1, 1, 0, 0, 1), (), (1,), (1, 'a'), (2,)
+    ]
+
+    encoded = [ops.encode_value(value) for value in values]
+
+    assert encoded == sorted(encoded)
+    assert len(set(encoded)) == len(encoded)
+    assert ops.encode_value(1) == ops.encode_value(1.0) == ops.encode_value(True)
+    assert ops.encode_value(0.0) == ops.encode_value(-0.0)
+    assert ops.encode_key([1, 'a']) < ops.encode_key([1, 'b']) < ops.encode_key([2, ''])
+
+    with pytest.raises(TypeError):
+        ops.encode_value({'not': 'a key'})
+
+
+def test_encoded_key_order_of_other_types() -> None:
+    values: list[tp.Any] = [
+        Decimal('-1e400'), Decimal(-2 ** 70) - Decimal('0.5'), -2 ** 70, -1, Decimal('-0.5'), 0, Decimal('0.1'), 0.1,
+        Decimal('0.10000000000000000555111512312578270211815834045410156251'), 1, 2 ** 70, Decimal(2 ** 70) + 1,
+        Decimal('1e400'), math.inf, 'a', timedelta(days=-1), timedelta(0), timedelta(microseconds=1), time(0),
+        time(12, 30), uuid.UUID(int=1), uuid.UUID(int=2 ** 127)
+    ]
+
+    encoded = [ops.encode_value(value) for value in values]
+
+    assert encoded == sorted(encoded)
+    assert len(set(encoded)) == len(encoded)
+    assert ops.encode_value(Decimal('1.50')) == ops.encode_value(1.5)
+    assert ops.encode_value(ops.np.int64(3)) == ops.encode_value(3)
+
+
+@pytest.mark.parametrize('values', [
+    [Decimal(i * 7 % 11) / 4 for i in range(30)],
+    [timedelta(minutes=i * 7 % 11 - 5) for i in range(30)],
+    [Fraction(i * 7 % 11, 3) for i in range(30)],
+])
+def test_sort_and_join_other_key_types(values: list[tp.Any]) -> None:
+    left: list[ops.TRow] = [{'key': value, 'a': i} for i, value in enumerate(values)]
+    right: list[ops.TRow] = [{'key': value, 'b': i} for i, value in enumerate(values[::3])]
+    expected_left = sorted(left, key=lambda row: row['key'])
+
+    assert list(ExternalSort(['key'], memory_limit=1000)(iter(left))) == expected_left
+    assert list(ops.SortLimit(['key'], 5)(iter(left))) == expected_left[:5]
+
+    expected_right = sorted(right, key=lambda row: row['key'])
+    expected = [dict(row_left, b=row_right['b']) for row_left in expected_left
+                for row_right in expected_right if row_left['key'] == row_right['key']]
+    merge_join = ops.Join(ops.InnerJoiner(), ['key'])(iter(expected_left), iter(expected_right))
+    assert list(merge_join) == expected
+    hash_join = HashJoin(ops.InnerJoiner(), ['key'], memory_limit=1000)(iter(left), iter(right))
+    assert sorted(hash_join, key=lambda row: (row['key'], row['a'], row['b'])) == expected
+
+
+def test_sort_and_join_mixed_keys() -> None:
+    left: list[ops.TRow] = [{'key': 'b', 'a': 1}, {'key': None, 'a': 2}, {'key': 3, 'a': 3}, {'key': 1.5, 'a': 4}]
+    right: list[ops.TRow] = [{'key': 1.5, 'b': 1}, {'key': None, 'b': 2}, {'key': 'b', 'b': 3}]
+
+    sorted_left = list(ExternalSort(['key'])(iter(left)))
+    assert [row['a'] for row in sorted_left] == [2, 4, 3, 1]
+
+    sorted_right = ops.sort_rows(right, ['key'])
+    result = ops.Join(ops.InnerJoiner(), ['key'])(iter(sorted_left), iter(sorted_right))
+    assert list(result) == [
+        {'key': None, 'a': 2, 'b': 2},
+        {'key': 1.5, 'a': 4, 'b': 1},
+        {'key': 'b', 'a': 1, 'b': 3},
+    ]
+
+
+def test_sorter_pool_reuses_processes() -> None:
+    data = [{'key': i % 7} for i in range(100)]
+    list(ExternalSort(['key'])(iter(data)))
+    started = sorters.started
+
+    for _ in range(3):
+        assert list(ExternalSort(['key'])(iter(data))) == sorted(data, key=lambda row: row['key'])
+    assert sorters.started == started
+
+    rows = ExternalSort(['key'])(iter(data))
+    next(rows)
+    rows.close()
+    assert list(ExternalSort(['key'])(iter(data))) == sorted(data, key=lambda row: row['key'])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_early_closed_sort_removes_spills(tmp_path: tp.Any, monkeypatch: pytest.MonkeyPatch, workers: int) -> None:
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    data = [{'key': i * 7919 % 1000, 'n': i} for i in range(20000)]
+
+    rows = ExternalSort(['key'], memory_limit=10000, workers=workers)(iter(data))
+    next(rows)
+    assert list(tmp_path.iterdir())
+    rows.close()
+
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize('values', [
+    [i * 7919 % 101 for i in range(1000)],
+    [(i * 7919 % 101) / 4 for i in range(1000)],
+    [i * 7919 % 101 if i % 2 else (i * 7919 % 101) / 2 for i in range(1000)],
+    [2 ** 64 - i * 7919 % 101 for i in range(1000)],
+    [i * 7919 % 101 if i % 2 else str(i) for i in range(1000)],
+])
+def test_sort_rows(values: list[tp.Any]) -> None:
+    rows = [{'key': value, 'group': i % 3, 'n': i} for i, value in enumerate(values)]
+
+    for keys in (['key'], ['group', 'key']):
+        expected = sorted(rows, key=lambda row: [ops.encode_value(row[key]) for key in keys])
+        assert ops.sort_rows(rows, keys) == expected
+
+
+@pytest.mark.parametrize('joiner', [ops.InnerJoiner(), ops.LeftJoiner(), ops.RightJoiner(), ops.OuterJoiner()])
+@pytest.mark.parametrize('memory_limit', [MEMORY_LIMIT, 1000])
+@pytest.mark.parametrize('sizes', [(300, 40), (40, 300), (0, 40), (40, 0)])
+def test_hash_join(joiner: ops.Joiner, memory_limit: int, sizes: tuple[int, int]) -> None:
+    left = [{'key': i * 7 % 50, 'value': i, 'a': -i} for i in range(sizes[0])]
+    right = [{'key': i * 3 % 70, 'value': i, 'b': i} for i in range(sizes[1])]
+
+    def ordered(rows: tp.Iterable[ops.TRow]) -> list[list[tuple[str, tp.Any]]]:
+        return sorted(sorted(row.items()) for row in rows)
+
+    expected = ops.Join(joiner, ['key'])(iter(ops.sort_rows(left, ['key'])), iter(ops.sort_rows(right, ['key'])))
+    result = HashJoin(joiner, ['key'], memory_limit=memory_limit)(iter(left), iter(right))
+
+    assert ordered(result) == ordered(expected)
+
+
+@pytest.mark.parametrize('joiner, keys', [
+    (ops.InnerJoiner(), ['key']), (ops.LeftJoiner(), ['key']),
+    (ops.InnerJoiner(), []), (ops.LeftJoiner(), []), (ops.RightJoiner(), []), (ops.OuterJoiner(), []),
+])
+@pytest.mark.parametrize('sizes', [(300, 40), (40, 0), (0, 40)])
+def test_broadcast_join(joiner: ops.Joiner, keys: list[str], sizes: tuple[int, int]) -> None:
+    left = ops.sort_rows([{'key': i * 7 % 50, 'value': i, 'a': -i} for i in range(sizes[0])], ['key'])
+    right = [{'key': i * 3 % 70, 'value': i, 'b': i} for i in range(sizes[1])]
+
+    expected = ops.Join(joiner, keys)(iter(left), iter(ops.sort_rows(right, keys)))
+    result = ops.BroadcastJoin(joiner, keys)(iter(left), iter(right))
+
+    assert list(result) == list(expected)
+
+
+def test_inner_join_layouts() -> None:
+    joiner = ops.InnerJoiner(suffix_a='_a', suffix_b='_b')
+    rows_a = [{'key': 1, 'x': 1, 'a': 2}, {'a': 3, 'key': 1, 'x': 4}, {'key': 1, 'x': 5}]
+    rows_b = [{'key': 1, 'x': 6, 'b': 7}, {'key': 1, 'a': 8}]
+
+    assert list(joiner(['key'], rows_a, rows_b)) == [
+        {'key': 1, 'a': 2, 'x_a': 1, 'x_b': 6, 'b': 7},
+        {'key': 1, 'x': 1, 'a_a': 2, 'a_b': 8},
+        {'key': 1, 'a': 3, 'x_a': 4, 'x_b': 6, 'b': 7},
+        {'key': 1, 'x': 4, 'a_a': 3, 'a_b': 8},
+        {'key': 1, 'x_a': 5, 'x_b': 6, 'b': 7},
+        {'key': 1, 'x': 5, 'a': 8},
+    ]
+
+    streamed = joiner(['key'], rows_a[:1], ({'key': 1, 'b': i} for i in itertools.count()))
+    assert list(itertools.islice(streamed, 3)) == [{'key': 1, 'x': 1, 'a': 2, 'b': i} for i in range(3)]
+
+
+def test_join_spills_large_groups(monkeypatch: pytest.MonkeyPatch) -> None:
+    left = [{'key': i % 3, 'a': i} for i in range(30)]
+    right = [{'key': i % 2, 'b': i} for i in range(3000)]
+    join = ops.Join(ops.InnerJoiner(), ['key'])
+    expected = list(join(iter(ops.sort_rows(left, ['key'])), iter(ops.sort_rows(right, ['key']))))
+
+    groups = ops.join_spills.groups
+    monkeypatch.setattr(ops.operations_spill, 'JOIN_GROUP_MEMORY_LIMIT', 10000)
+    result = list(join(iter(ops.sort_rows(left, ['key'])), iter(ops.sort_rows(right, ['key']))))
+
+    assert result == expected
+    assert ops.join_spills.groups == groups + 2
+
+
+@pytest.mark.parametrize('exact_limit', [EXACT_KEYS_LIMIT, 100])
+def test_semi_join_filter(exact_limit: int) -> None:
+    rows = [{'key': i, 'value': i} for i in range(1000)]
+    keys = [{'key': i} for i in range(0, 1000, 7)]
+
+    result = list(SemiJoinFilter(['key'], exact_limit)(iter(rows), iter(keys)))
+
+    assert [row for row in rows if row['key'] % 7 == 0] == [row for row in result if row['key'] % 7 == 0]
+    assert len(result) < 160
+
+
+@pytest.mark.parametrize('reducer', [ops.Count('count'), ops.Sum('value')])
+@pytest.mark.parametrize('keys', [['key'], ['key', 'other'], []])
+@pytest.mark.parametrize('max_groups', [MAX_GROUPS, 7])
+def test_hash_aggregate(reducer: ops.CombinableReducer, keys: list[str], max_groups: int) -> None:
+    rows = [{'key': i * 7 % 50, 'other': i % 3, 'value': i} for i in range(1000)]
+
+    expected = ops.Reduce(reducer, keys)(iter(ops.sort_rows(rows, keys)))
+    result = HashAggregate(reducer, keys, max_groups=max_groups, partitions=4)(iter(rows))
+
+    assert list(result) == list(expected)
+
+
+@pytest.mark.parametrize('reducer', [ops.Count('count'), ops.Sum('value'), ops.TermFrequency('word')])
+@pytest.mark.parametrize('max_groups', [COMBINE_MAX_GROUPS, 3])
+def test_partial_aggregate(reducer: ops.CombinableReducer, max_groups: int) -> None:
+    rows = [{'key': i * 7 % 5, 'word': f'w{i % 4}', 'value': i} for i in range(100)]
+
+    expected = ops.Reduce(reducer, ['key'])(iter(ops.sort_rows(rows, ['key'])))
+    partials = PartialAggregate(reducer, ['key'], max_groups)(iter(rows))
+    result = MergeAggregate(reducer, ['key'])(iter(ops.sort_rows(partials, ['key'])))
+
+    assert list(result) == list(expected)
+
+
+def test_aggregate() -> None:
+    reducer = ops.Aggregate(
+        total=ops.Sum('value'), trips=ops.Count('trips'), mean=ops.Mean('value'),
+        low=ops.Min('value'), high=ops.Max('value'), first=ops.First('value')
+    )
+    rows = [{'key': i % 2, 'value': (i * 7) % 10} for i in range(10)]
+
+    result = ops.Reduce(reducer, ['key'])(iter(ops.sort_rows(rows, ['key'])))
+
+    assert list(result) == [
+        {'key': 0, 'total': 20, 'trips': 5, 'mean': 4.0, 'low': 0, 'high': 8, 'first': 0},
+        {'key': 1, 'total': 25, 'trips': 5, 'mean': 5.0, 'low': 1, 'high': 9, 'first': 7},
+    ]
+
+    partials = PartialAggregate(reducer, ['key'], max_groups=1)(iter(rows))
+    merged = MergeAggregate(reducer, ['key'])(iter(ops.sort_rows(partials, ['key'])))
+    assert list(merged) == list(ops.Reduce(reducer, ['key'])(iter(ops.sort_rows(rows, ['key']))))
+
+
+@pytest.mark.parametrize('memory_limit', [MEMORY_LIMIT, 20000])
+def test_partitioned_sort_reduce(memory_limit: int) -> None:
+    rows = [{'key': i % 97, 'value': i} for i in range(3 * IPC_CHUNK_SIZE)]
+    reducer = ops.FirstReducer()
+
+    expected = list(ops.Reduce(reducer, ['key'])(iter(ops.sort_rows(rows, ['key', 'value']))))
+    result = list(PartitionedSortReduce(['key', 'value'], reducer, ['key'], 2, memory_limit)(iter(rows[::-1])))
+
+    assert expected == [{'key': i, 'value': i} for i in range(97)]
+    assert result == expected
+
+
+def test_early_closed_partitioned_sort_reduce_removes_spills(tmp_path: tp.Any, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    rows = [{'key': i % 97, 'value': i} for i in range(3 * IPC_CHUNK_SIZE)]
+
+    result = PartitionedSortReduce(['key', 'value'], ops.FirstReducer(), ['key'], 2, 20000)(iter(rows))
+    next(result)
+    assert list(tmp_path.iterdir())
+    result.close()
+
+    assert not list(tmp_path.iterdir())